@@ -5,6 +5,14 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_mail import Mail
 from config import Config
+from app.events import EventStream
+from app.cleanup import FileCleaner
+from app.tokenfilter import ShareTokenFilter
+from app.storage import StorageTiering
+from app.tracing import Tracer
+from app.admission import UploadAdmission
+from app.metadata import MetadataExtractor
+from app.preview import PreviewGenerator
 import os
 
 # Initialize extensions
@@ -12,17 +20,37 @@ db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 mail = Mail()
+events = EventStream()
+cleaner = FileCleaner()
+token_filter = ShareTokenFilter()
+tiering = StorageTiering()
+tracer = Tracer()
+upload_admission = UploadAdmission()
+metadata_extractor = MetadataExtractor()
+previews = PreviewGenerator()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    from app import jsonprovider, offload
+    jsonprovider.init_app(app)
+    offload.init_app(app)
+    
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
     CORS(app, origins=['*'], supports_credentials=True)  # Allow all origins for development
     mail.init_app(app)
+    events.init_app(app)
+    cleaner.init_app(app)
+    token_filter.init_app(app)
+    tiering.init_app(app)
+    tracer.init_app(app)
+    upload_admission.init_app(app)
+    metadata_extractor.init_app(app)
+    previews.init_app(app)
     
     # Create upload directory if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -38,6 +66,10 @@ def create_app(config_class=Config):
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     app.register_blueprint(share_bp, url_prefix='/share')
     
+    from app import search, reconcile
+    search.init_app(app)
+    reconcile.init_app(app)
+    
     # Health check endpoint
     @app.route('/api/health')
     def health_check():
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
-from app.models import User, FileUpload
+from app import db, events, cleaner, token_filter, tiering, upload_admission, previews
+from app.cleanup import queue_file_removal
+from app.events import UPLOAD_DELETED
+from app.export import export_response, get_export_format
+from app.fields import UPLOAD_FIELDS, USER_FIELDS
+from app.models import User, FileUpload, ShareLink, UploadSession, UploadPart, CleanupJob, ShareAccess
+from app.search import filter_uploads, parse_datetime, search_uploads
+from datetime import datetime, timedelta
 from email_validator import validate_email, EmailNotValidError
 import bcrypt
 
@@ -13,7 +19,7 @@ def require_admin(f):
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        if not user or not user.is_admin:
+        if not user or not user.is_admin or not user.is_active:
             return jsonify({'error': 'Admin access required'}), 403
         
         return f(*args, **kwargs)
@@ -29,12 +35,13 @@ def get_all_users():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 10, type=int), 100)
+        fields = USER_FIELDS.parse(request.args)
         
-        users_query = User.query.order_by(User.created_at.desc())
+        users_query = USER_FIELDS.query(fields).order_by(User.created_at.desc())
         users = users_query.paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
-            'users': [user.to_dict() for user in users.items],
+            'users': [USER_FIELDS.serialize(user, fields) for user in users.items],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -43,6 +50,8 @@ def get_all_users():
             }
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to fetch users'}), 500
 
@@ -158,19 +167,160 @@ def delete_user(user_id):
         if user_id == current_user_id:
             return jsonify({'error': 'Cannot delete your own account'}), 400
         
-        user = User.query.get(user_id)
-        if not user:
+        if not db.session.query(User.id).filter_by(id=user_id).first():
             return jsonify({'error': 'User not found'}), 404
         
-        db.session.delete(user)
-        db.session.commit()
+        job, _ = delete_users_and_files([user_id], current_user_id, f'Delete user {user_id}')
         
-        return jsonify({'message': 'User deleted successfully'})
+        return jsonify({
+            'message': 'User deleted successfully',
+            'cleanup_job': job.to_dict()
+        })
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to delete user'}), 500
 
+def get_bulk_ids(data, key):
+    """Read and validate a list of ids from a bulk request body"""
+    ids = data.get(key) if data else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, str) for i in ids):
+        return None, (jsonify({'error': f'{key} must be a non-empty list of ids'}), 400)
+    
+    max_ids = current_app.config.get('ADMIN_BULK_MAX_IDS', 500)
+    if len(ids) > max_ids:
+        return None, (jsonify({'error': f'At most {max_ids} ids per request'}), 400)
+    
+    return list(set(ids)), None
+
+def delete_share_links(uploads_criteria):
+    """Delete the share links of the uploads matching criteria, before the uploads themselves"""
+    db.session.execute(
+        db.delete(ShareLink)
+        .where(ShareLink.upload_id.in_(db.select(FileUpload.id).where(uploads_criteria)))
+        .execution_options(synchronize_session=False)
+    )
+
+def delete_users_and_files(user_ids, admin_id, description):
+    """Delete users and all their uploads with set-based SQL.
+    
+    The upload rows are deleted in one statement instead of through the ORM
+    cascade; their files (and those of unfinished chunked uploads) are handed
+    to a background cleanup job.
+    """
+    uploads_filter = FileUpload.uploader_id.in_(user_ids)
+    sessions_filter = UploadSession.user_id.in_(user_ids)
+    paths = db.union_all(
+        db.select(FileUpload.upload_path).where(uploads_filter),
+        db.select(UploadSession.path).where(sessions_filter)
+    )
+    job = queue_file_removal(description, paths, admin_id)
+    
+    delete_share_links(uploads_filter)
+    db.session.execute(
+        db.delete(UploadPart)
+        .where(UploadPart.session_id.in_(db.select(UploadSession.id).where(sessions_filter)))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(db.delete(UploadSession).where(sessions_filter).execution_options(synchronize_session=False))
+    db.session.execute(db.delete(FileUpload).where(uploads_filter).execution_options(synchronize_session=False))
+    deleted = db.session.execute(db.delete(User).where(User.id.in_(user_ids)).execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    
+    token_filter.mark_stale(job.total_files)
+    cleaner.schedule(job.id)
+    return job, deleted
+
+def remove_uploads_and_files(criteria, admin_id, description, hard_delete, notify=False):
+    """Delete or deactivate the uploads matching criteria and queue their files.
+    
+    With notify, uploaders get an upload.deleted event for each affected upload;
+    only used for id-list requests, whose size is bounded.
+    """
+    affected = []
+    if notify:
+        affected = db.session.query(FileUpload.id, FileUpload.uploader_id).filter(criteria, FileUpload.is_active.is_(True)).all()
+    
+    job = queue_file_removal(description, db.select(FileUpload.upload_path).where(criteria), admin_id)
+    
+    if hard_delete:
+        delete_share_links(criteria)
+        statement = db.delete(FileUpload).where(criteria)
+    else:
+        statement = db.update(FileUpload).where(criteria, FileUpload.is_active.is_(True)).values(
+            is_active=False,
+            updated_at=datetime.utcnow()
+        )
+    count = db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    
+    token_filter.mark_stale(count)
+    cleaner.schedule(job.id)
+    for upload_id, uploader_id in affected:
+        events.publish(uploader_id, UPLOAD_DELETED, {'id': upload_id})
+    return job, count
+
+@bp.route('/users/bulk-delete', methods=['POST'])
+@jwt_required()
+@require_admin
+def bulk_delete_users():
+    """Delete many users, their uploads and (in the background) their files"""
+    try:
+        current_user_id = get_jwt_identity()
+        user_ids, error = get_bulk_ids(request.get_json(silent=True), 'user_ids')
+        if error:
+            return error
+        
+        if current_user_id in user_ids:
+            return jsonify({'error': 'Cannot delete your own account'}), 400
+        
+        job, deleted = delete_users_and_files(user_ids, current_user_id, f'Bulk delete of {len(user_ids)} users')
+        
+        return jsonify({
+            'message': 'Users deleted successfully',
+            'deleted': deleted,
+            'cleanup_job': job.to_dict()
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk user delete error: {e}")
+        return jsonify({'error': 'Failed to delete users'}), 500
+
+@bp.route('/users/bulk-deactivate', methods=['POST'])
+@jwt_required()
+@require_admin
+def bulk_deactivate_users():
+    """Deactivate (or with "active": true, reactivate) many users"""
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json(silent=True)
+        user_ids, error = get_bulk_ids(data, 'user_ids')
+        if error:
+            return error
+        
+        active = bool(data.get('active', False))
+        if not active and current_user_id in user_ids:
+            return jsonify({'error': 'Cannot deactivate your own account'}), 400
+        
+        updated = db.session.execute(
+            db.update(User)
+            .where(User.id.in_(user_ids), User.is_active.isnot(active))
+            .values(is_active=active, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        
+        return jsonify({
+            'message': f"Users {'activated' if active else 'deactivated'} successfully",
+            'updated': updated
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk user deactivate error: {e}")
+        return jsonify({'error': 'Failed to update users'}), 500
+
 @bp.route('/uploads', methods=['GET'])
 @jwt_required()
 @require_admin
@@ -179,12 +329,13 @@ def get_all_uploads():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 10, type=int), 100)
+        fields = UPLOAD_FIELDS.parse(request.args)
         
-        uploads_query = FileUpload.query.order_by(FileUpload.created_at.desc())
+        uploads_query = UPLOAD_FIELDS.query(fields).order_by(FileUpload.created_at.desc())
         uploads = uploads_query.paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
-            'uploads': [upload.to_dict() for upload in uploads.items],
+            'uploads': [UPLOAD_FIELDS.serialize(upload, fields) for upload in uploads.items],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -193,9 +344,341 @@ def get_all_uploads():
             }
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to fetch uploads'}), 500
 
+@bp.route('/uploads/search', methods=['GET'])
+@jwt_required()
+@require_admin
+def search_all_uploads():
+    """Search all uploads with filters, sorting and keyset paging"""
+    try:
+        query = FileUpload.query
+        uploader_id = request.args.get('uploader_id')
+        if uploader_id:
+            query = query.filter(FileUpload.uploader_id == uploader_id)
+        
+        uploads, next_cursor = search_uploads(request.args, query)
+        
+        return jsonify({
+            'uploads': [upload.to_dict() for upload in uploads],
+            'next_cursor': next_cursor
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Upload search error: {e}")
+        return jsonify({'error': 'Failed to search uploads'}), 500
+
+@bp.route('/uploads/bulk-delete', methods=['POST'])
+@jwt_required()
+@require_admin
+def bulk_delete_uploads():
+    """Permanently delete many uploads and (in the background) their files"""
+    try:
+        upload_ids, error = get_bulk_ids(request.get_json(silent=True), 'upload_ids')
+        if error:
+            return error
+        
+        job, deleted = remove_uploads_and_files(
+            FileUpload.id.in_(upload_ids),
+            get_jwt_identity(),
+            f'Bulk delete of {len(upload_ids)} uploads',
+            hard_delete=True,
+            notify=True
+        )
+        
+        return jsonify({
+            'message': 'Uploads deleted successfully',
+            'deleted': deleted,
+            'cleanup_job': job.to_dict()
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk upload delete error: {e}")
+        return jsonify({'error': 'Failed to delete uploads'}), 500
+
+@bp.route('/uploads/bulk-deactivate', methods=['POST'])
+@jwt_required()
+@require_admin
+def bulk_deactivate_uploads():
+    """Deactivate many uploads, as if each uploader had deleted them"""
+    try:
+        upload_ids, error = get_bulk_ids(request.get_json(silent=True), 'upload_ids')
+        if error:
+            return error
+        
+        job, deactivated = remove_uploads_and_files(
+            FileUpload.id.in_(upload_ids),
+            get_jwt_identity(),
+            f'Bulk deactivation of {len(upload_ids)} uploads',
+            hard_delete=False,
+            notify=True
+        )
+        
+        return jsonify({
+            'message': 'Uploads deactivated successfully',
+            'deactivated': deactivated,
+            'cleanup_job': job.to_dict()
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk upload deactivate error: {e}")
+        return jsonify({'error': 'Failed to deactivate uploads'}), 500
+
+@bp.route('/uploads/purge', methods=['POST'])
+@jwt_required()
+@require_admin
+def purge_uploads():
+    """Permanently delete uploads by age and/or size"""
+    try:
+        data = request.get_json(silent=True) or {}
+        older_than_days = data.get('older_than_days')
+        min_size = data.get('min_size')
+        inactive_only = bool(data.get('inactive_only', False))
+        
+        criteria = []
+        description = []
+        if older_than_days is not None:
+            if not isinstance(older_than_days, int) or older_than_days < 0:
+                return jsonify({'error': 'older_than_days must be a non-negative integer'}), 400
+            criteria.append(FileUpload.created_at < datetime.utcnow() - timedelta(days=older_than_days))
+            description.append(f'older than {older_than_days} days')
+        if min_size is not None:
+            if not isinstance(min_size, int) or min_size < 0:
+                return jsonify({'error': 'min_size must be a non-negative integer'}), 400
+            criteria.append(FileUpload.size >= min_size)
+            description.append(f'at least {min_size} bytes')
+        
+        if not criteria:
+            return jsonify({'error': 'Provide older_than_days and/or min_size'}), 400
+        
+        if inactive_only:
+            criteria.append(FileUpload.is_active.is_(False))
+            description.append('inactive')
+        
+        job, deleted = remove_uploads_and_files(
+            db.and_(*criteria),
+            get_jwt_identity(),
+            f"Purge of uploads {', '.join(description)}",
+            hard_delete=True
+        )
+        
+        return jsonify({
+            'message': 'Uploads purged successfully',
+            'deleted': deleted,
+            'cleanup_job': job.to_dict()
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload purge error: {e}")
+        return jsonify({'error': 'Failed to purge uploads'}), 500
+
+@bp.route('/jobs', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_cleanup_jobs():
+    """List recent file cleanup jobs"""
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        jobs = CleanupJob.query.order_by(CleanupJob.created_at.desc()).limit(limit).all()
+        
+        return jsonify({'jobs': [dict(job.to_dict(), running=cleaner.is_running(job.id)) for job in jobs]})
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch jobs'}), 500
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_cleanup_job(job_id):
+    """Report progress of a file cleanup job"""
+    try:
+        job = CleanupJob.query.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({'job': dict(job.to_dict(), running=cleaner.is_running(job.id))})
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch job'}), 500
+
+@bp.route('/jobs/<job_id>/resume', methods=['POST'])
+@jwt_required()
+@require_admin
+def resume_cleanup_job(job_id):
+    """Resume an interrupted or partially failed cleanup job"""
+    try:
+        job = CleanupJob.query.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        if job.status == 'completed':
+            return jsonify({'message': 'Job already completed', 'job': job.to_dict()})
+        
+        if not cleaner.schedule(job.id):
+            return jsonify({'error': 'Job is already running'}), 409
+        
+        return jsonify({'message': 'Job resumed', 'job': job.to_dict()}), 202
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to resume job'}), 500
+
+@bp.route('/storage', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_storage_stats():
+    """Report files and bytes per storage tier and the last tiering run"""
+    try:
+        return jsonify({'storage': tiering.stats()})
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch storage statistics'}), 500
+
+@bp.route('/storage/tier', methods=['POST'])
+@jwt_required()
+@require_admin
+def run_storage_tiering():
+    """Start moving cold files to the cold tier in the background"""
+    if not tiering.enabled:
+        return jsonify({'error': 'Cold storage is not configured'}), 400
+    
+    if not tiering.run_async():
+        return jsonify({'error': 'Tiering is already running'}), 409
+    
+    return jsonify({'message': 'Tiering started'}), 202
+
+@bp.route('/share-filter', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_share_filter_stats():
+    """Report share token filter size, accuracy and hit counters for this worker"""
+    return jsonify({'share_filter': token_filter.stats()})
+
+@bp.route('/upload-admission', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_upload_admission_stats():
+    """Report the upload concurrency limit, queue depth and wait times for this worker"""
+    return jsonify({'upload_admission': upload_admission.stats()})
+
+@bp.route('/previews', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_preview_stats():
+    """Report share preview generation and cache usage for this worker"""
+    return jsonify({'previews': previews.stats()})
+
+@bp.route('/export/uploads', methods=['GET'])
+@jwt_required()
+@require_admin
+def export_uploads():
+    """Stream all uploads matching the search filters as CSV or NDJSON"""
+    try:
+        fmt = get_export_format(request.args)
+        
+        query = db.session.query(
+            FileUpload.id,
+            FileUpload.original_name,
+            FileUpload.mime_type,
+            FileUpload.size,
+            FileUpload.share_token,
+            FileUpload.recipient_email,
+            FileUpload.expires_at,
+            FileUpload.download_count,
+            FileUpload.max_downloads,
+            FileUpload.is_active,
+            FileUpload.created_at,
+            FileUpload.uploader_id,
+            User.email.label('uploader_email')
+        ).outerjoin(User, User.id == FileUpload.uploader_id)
+        
+        uploader_id = request.args.get('uploader_id')
+        if uploader_id:
+            query = query.filter(FileUpload.uploader_id == uploader_id)
+        query = filter_uploads(request.args, query)
+        
+        return export_response(query, FileUpload.id, fmt, 'uploads')
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Upload export error: {e}")
+        return jsonify({'error': 'Failed to export uploads'}), 500
+
+@bp.route('/export/users', methods=['GET'])
+@jwt_required()
+@require_admin
+def export_users():
+    """Stream users as CSV or NDJSON, filtered by is_admin, is_active and created_after/before"""
+    try:
+        fmt = get_export_format(request.args)
+        
+        query = db.session.query(
+            User.id,
+            User.email,
+            User.name,
+            User.is_admin,
+            User.is_active,
+            User.created_at,
+            User.updated_at
+        )
+        
+        for flag in ('is_admin', 'is_active'):
+            value = request.args.get(flag)
+            if value is not None:
+                query = query.filter(getattr(User, flag).is_(value.lower() in ['true', '1']))
+        if request.args.get('created_after'):
+            query = query.filter(User.created_at >= parse_datetime(request.args['created_after'], 'created_after'))
+        if request.args.get('created_before'):
+            query = query.filter(User.created_at < parse_datetime(request.args['created_before'], 'created_before'))
+        
+        return export_response(query, User.id, fmt, 'users')
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"User export error: {e}")
+        return jsonify({'error': 'Failed to export users'}), 500
+
+@bp.route('/export/share-access', methods=['GET'])
+@jwt_required()
+@require_admin
+def export_share_access():
+    """Stream the share access log as CSV or NDJSON, filtered by share_token, email and accessed_after/before"""
+    try:
+        fmt = get_export_format(request.args)
+        
+        query = db.session.query(
+            ShareAccess.id,
+            ShareAccess.share_token,
+            ShareAccess.email,
+            ShareAccess.accessed_at
+        )
+        
+        if request.args.get('share_token'):
+            query = query.filter(ShareAccess.share_token == request.args['share_token'])
+        if request.args.get('email'):
+            query = query.filter(ShareAccess.email == request.args['email'].strip())
+        if request.args.get('accessed_after'):
+            query = query.filter(ShareAccess.accessed_at >= parse_datetime(request.args['accessed_after'], 'accessed_after'))
+        if request.args.get('accessed_before'):
+            query = query.filter(ShareAccess.accessed_at < parse_datetime(request.args['accessed_before'], 'accessed_before'))
+        
+        return export_response(query, ShareAccess.id, fmt, 'share-access')
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Share access export error: {e}")
+        return jsonify({'error': 'Failed to export share access log'}), 500
+
 @bp.route('/stats', methods=['GET'])
 @jwt_required()
 @require_admin
@@ -0,0 +1,229 @@
+"""Admission control for uploads.
+
+Concurrent uploads share one disk and pin a worker each for as long as the
+body takes to arrive, so past a point more of them only makes all of them
+slower. The controller caps uploads in progress globally and per user; an
+upload over the cap waits up to UPLOAD_QUEUE_TIMEOUT seconds for a slot and
+is then turned away with 503 and a Retry-After estimate. The check runs
+before request.files is touched, so a rejected upload's body is never read.
+
+The parts of one chunked upload session count as one upload: the first part
+in flight takes the slot and up to UPLOAD_MAX_PARTS_PER_SESSION parts sent
+alongside it share it, so a client sending several parts at once is not held
+back by the per-user cap. Parts beyond that queue like any other upload.
+
+With UPLOAD_ADAPTIVE the global cap moves between UPLOAD_MIN_CONCURRENT and
+UPLOAD_MAX_CONCURRENT by hill climbing on observed throughput: after each
+window of busy uploads the cap steps in the direction that last raised the
+bytes per second accepted, and steps down when a larger cap stops paying off.
+
+Limits and metrics are per worker process.
+"""
+import math
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+
+# Throughput changes smaller than this are treated as no change
+THROUGHPUT_TOLERANCE = 0.05
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Too many uploads in progress')
+        self.retry_after = retry_after
+
+
+class UploadAdmission:
+    """Flask extension limiting concurrent uploads"""
+
+    def __init__(self, app=None):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._per_user = Counter()
+        self._sessions = Counter()
+        self._waits = deque(maxlen=1000)
+        self._avg_duration = None
+        self._last_throughput = None
+        self._direction = 1
+        self.metrics = {'admitted': 0, 'rejected': 0, 'queued': 0, 'max_queue_depth': 0, 'adjustments': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('UPLOAD_ADMISSION_ENABLED', True)
+        self.max_limit = app.config.get('UPLOAD_MAX_CONCURRENT', 8)
+        self.min_limit = min(app.config.get('UPLOAD_MIN_CONCURRENT', 2), self.max_limit)
+        self.per_user = app.config.get('UPLOAD_MAX_PER_USER', 2)
+        self.parts_per_session = app.config.get('UPLOAD_MAX_PARTS_PER_SESSION', 4)
+        self.queue_timeout = app.config.get('UPLOAD_QUEUE_TIMEOUT', 5.0)
+        self.max_queue = app.config.get('UPLOAD_QUEUE_MAX', 32)
+        self.max_retry_after = app.config.get('UPLOAD_RETRY_AFTER_MAX', 60)
+        self.adaptive = app.config.get('UPLOAD_ADAPTIVE', True)
+        self.limit = self.max_limit
+        self._reset_window()
+        app.extensions['upload_admission'] = self
+
+    def _reset_window(self):
+        self._window_started = time.monotonic()
+        self._window_bytes = 0
+        self._window_count = 0
+        self._window_saturated = False
+
+    def _can_enter(self, user_id, session_id):
+        if session_id is not None and self._sessions[user_id, session_id]:
+            return self._sessions[user_id, session_id] < self.parts_per_session
+        return self._active < self.limit and self._per_user[user_id] < self.per_user
+
+    def acquire(self, user_id, session_id=None):
+        """Take an upload slot, or share the one of session_id's parts in flight; returns the seconds waited"""
+        started = time.monotonic()
+        with self._cond:
+            if not self._can_enter(user_id, session_id):
+                self._window_saturated = True
+                if self._queued >= self.max_queue:
+                    self.metrics['rejected'] += 1
+                    raise AdmissionRejected(self.retry_after())
+                self._queued += 1
+                self.metrics['queued'] += 1
+                self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], self._queued)
+                try:
+                    deadline = started + self.queue_timeout
+                    while not self._can_enter(user_id, session_id):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.metrics['rejected'] += 1
+                            raise AdmissionRejected(self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+            if session_id is not None and self._sessions[user_id, session_id]:
+                self._sessions[user_id, session_id] += 1
+            else:
+                self._active += 1
+                self._per_user[user_id] += 1
+                if self._active >= self.limit:
+                    self._window_saturated = True
+                if session_id is not None:
+                    self._sessions[user_id, session_id] = 1
+                    # Other parts of this session may be queued behind the same limit
+                    self._cond.notify_all()
+            self.metrics['admitted'] += 1
+            waited = time.monotonic() - started
+            self._waits.append(waited)
+        return waited
+
+    def release(self, user_id, nbytes, seconds, session_id=None):
+        """Give a slot back, recording how many bytes the upload accepted in how long"""
+        with self._cond:
+            shared = False
+            if session_id is not None:
+                self._sessions[user_id, session_id] -= 1
+                shared = self._sessions[user_id, session_id] > 0
+                if not shared:
+                    del self._sessions[user_id, session_id]
+            if not shared:
+                self._active -= 1
+                self._per_user[user_id] -= 1
+                if self._per_user[user_id] <= 0:
+                    del self._per_user[user_id]
+            if nbytes:
+                self._avg_duration = seconds if self._avg_duration is None else 0.8 * self._avg_duration + 0.2 * seconds
+                self._window_bytes += nbytes
+                self._window_count += 1
+                if self.adaptive and self._window_count >= max(2 * self.limit, 8):
+                    self._adjust()
+            self._cond.notify_all()
+
+    def _adjust(self):
+        """Step the limit towards higher throughput; called with the lock held"""
+        elapsed = time.monotonic() - self._window_started
+        throughput = self._window_bytes / elapsed if elapsed > 0 else 0
+        # Only a window that was held back by the limit says anything about it
+        if self._window_saturated:
+            if self._last_throughput is not None:
+                if throughput > self._last_throughput * (1 + THROUGHPUT_TOLERANCE):
+                    pass
+                elif throughput < self._last_throughput * (1 - THROUGHPUT_TOLERANCE):
+                    self._direction = -self._direction
+                else:
+                    self._direction = -1
+            new_limit = min(max(self.limit + self._direction, self.min_limit), self.max_limit)
+            if new_limit != self.limit:
+                self.limit = new_limit
+                self.metrics['adjustments'] += 1
+            self._last_throughput = throughput
+        self._reset_window()
+
+    def retry_after(self):
+        """Seconds until a slot is likely to be free"""
+        if self._avg_duration is None:
+            estimate = 2 * self.queue_timeout
+        else:
+            estimate = self._avg_duration * (self._queued + 1) / max(self.limit, 1)
+        return min(max(math.ceil(estimate), 1), self.max_retry_after)
+
+    def guard(self, f):
+        """Decorate an upload view (after jwt_required) to run it under admission control.
+
+        Views with a session_id argument upload parts of that session, which share a slot.
+        """
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from flask import current_app, jsonify, request
+            from flask_jwt_extended import get_jwt_identity
+            from app.tracing import span
+
+            if not self.enabled:
+                return f(*args, **kwargs)
+
+            user_id = get_jwt_identity()
+            session_id = kwargs.get('session_id')
+            try:
+                with span('upload.admission'):
+                    self.acquire(user_id, session_id)
+            except AdmissionRejected as e:
+                response = jsonify({'error': 'Too many uploads in progress. Please retry later.'})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                # The body was never read, so the connection cannot be reused
+                response.headers['Connection'] = 'close'
+                return response
+
+            started = time.monotonic()
+            nbytes = 0
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 201:
+                    nbytes = request.content_length or 0
+                return response
+            finally:
+                self.release(user_id, nbytes, time.monotonic() - started, session_id)
+
+        return decorated_function
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                'enabled': self.enabled,
+                'adaptive': self.adaptive,
+                'limit': self.limit,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'per_user_limit': self.per_user,
+                'parts_per_session_limit': self.parts_per_session,
+                'active': self._active,
+                'active_sessions': len(self._sessions),
+                'queue_depth': self._queued,
+                'wait_ms': {
+                    'p50': round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    'p95': round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+                    'max': round(waits[-1] * 1000, 1) if waits else None
+                },
+                'last_throughput_bytes_per_second': round(self._last_throughput) if self._last_throughput else None,
+                'avg_upload_seconds': round(self._avg_duration, 3) if self._avg_duration else None,
+                **self.metrics
+            }
@@ -1,12 +1,23 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from app import db
+from app import db, jwt
 from app.models import User
+from app.tracing import span
 from email_validator import validate_email, EmailNotValidError
 import bcrypt
 
 bp = Blueprint('auth', __name__)
 
+@jwt.user_lookup_loader
+def load_token_user(jwt_header, jwt_data):
+    """Resolve every protected request's token to an active user, so deactivation takes effect at once"""
+    user = db.session.get(User, jwt_data['sub'])
+    return user if user and user.is_active else None
+
+@jwt.user_lookup_error_loader
+def token_user_not_found(jwt_header, jwt_data):
+    return jsonify({'error': 'User not found or deactivated'}), 401
+
 @bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -27,7 +38,8 @@ def register():
         
         # Validate email format
         try:
-            validate_email(email)
+            with span('auth.validate_email'):
+                validate_email(email)
         except EmailNotValidError:
             return jsonify({'error': 'Invalid email format'}), 400
         
@@ -40,7 +52,8 @@ def register():
             return jsonify({'error': 'User already exists'}), 400
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with span('auth.hash_password'):
+            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
         # Create user
         user = User(
@@ -51,7 +64,8 @@ def register():
         )
         
         db.session.add(user)
-        db.session.commit()
+        with span('db.commit'):
+            db.session.commit()
         
         # Create access token
         access_token = create_access_token(identity=user.id)
@@ -78,11 +92,18 @@ def login():
         password = data['password']
         
         # Find user
-        user = User.query.filter_by(email=email).first()
+        with span('auth.lookup'):
+            user = User.query.filter_by(email=email).first()
         
-        if not user or not bcrypt.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8')):
+        with span('auth.check_password'):
+            valid = bool(user) and bcrypt.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8'))
+        
+        if not valid:
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        if not user.is_active:
+            return jsonify({'error': 'Account is deactivated'}), 403
+        
         # Create access token
         access_token = create_access_token(identity=user.id)
         
@@ -102,7 +123,7 @@ def get_current_user():
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        if not user:
+        if not user or not user.is_active:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({'user': user.to_dict()})
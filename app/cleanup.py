@@ -0,0 +1,141 @@
+"""Background removal of uploaded files after bulk deletes.
+
+Bulk admin operations delete rows with set-based SQL and, in the same
+transaction, record the affected paths as PendingFileDeletion rows owned by a
+CleanupJob. The FileCleaner then removes those files in a bounded thread pool,
+deleting each pending row once its file is gone. A job interrupted by a
+restart simply resumes from whatever rows are left.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def remove_file(path):
+    """Remove a file, treating an already missing file as removed"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+class FileCleaner:
+    """Runs CleanupJobs on a shared, bounded pool of worker threads"""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._running = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('CLEANUP_WORKERS', 4)
+        self.batch_size = app.config.get('CLEANUP_BATCH_SIZE', 500)
+        app.extensions['file_cleaner'] = self
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='file-cleanup')
+            return self._executor
+
+    def is_running(self, job_id):
+        with self._lock:
+            return job_id in self._running
+
+    def schedule(self, job_id):
+        """Start (or resume) a job in the background; returns False if it is already running"""
+        from flask import current_app
+        with self._lock:
+            if job_id in self._running:
+                return False
+            self._running.add(job_id)
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=self._run, args=(app, job_id), name=f'cleanup-{job_id}', daemon=True)
+        thread.start()
+        return True
+
+    def _run(self, app, job_id):
+        from app import db
+        from app.models import CleanupJob, PendingFileDeletion
+        try:
+            with app.app_context():
+                job = db.session.get(CleanupJob, job_id)
+                if not job:
+                    return
+                job.status = 'running'
+                job.failed_files = 0
+                db.session.commit()
+
+                last_id = 0
+                while True:
+                    batch = db.session.query(PendingFileDeletion.id, PendingFileDeletion.path).filter(
+                        PendingFileDeletion.job_id == job_id,
+                        PendingFileDeletion.id > last_id
+                    ).order_by(PendingFileDeletion.id).limit(self.batch_size).all()
+                    if not batch:
+                        break
+                    last_id = batch[-1].id
+
+                    results = list(self.executor.map(remove_file, [row.path for row in batch]))
+                    removed_ids = [row.id for row, ok in zip(batch, results) if ok]
+                    failed_ids = [row.id for row, ok in zip(batch, results) if not ok]
+
+                    if removed_ids:
+                        db.session.execute(db.delete(PendingFileDeletion).where(PendingFileDeletion.id.in_(removed_ids)))
+                    if failed_ids:
+                        db.session.execute(
+                            db.update(PendingFileDeletion)
+                            .where(PendingFileDeletion.id.in_(failed_ids))
+                            .values(attempts=PendingFileDeletion.attempts + 1)
+                        )
+                    job.removed_files = CleanupJob.removed_files + len(removed_ids)
+                    job.failed_files = CleanupJob.failed_files + len(failed_ids)
+                    db.session.commit()
+
+                    if failed_ids:
+                        app.logger.error(f"Cleanup job {job_id}: failed to remove {len(failed_ids)} files")
+
+                job.status = 'completed_with_errors' if job.failed_files else 'completed'
+                db.session.commit()
+        except Exception as e:
+            app.logger.error(f"Cleanup job {job_id} error: {e}")
+            with app.app_context():
+                db.session.rollback()
+                job = db.session.get(CleanupJob, job_id)
+                if job:
+                    job.status = 'failed'
+                    db.session.commit()
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+
+def queue_file_removal(description, paths_select, created_by=None):
+    """Create a CleanupJob from a SELECT of file paths.
+
+    The paths are copied with INSERT ... SELECT so they never pass through
+    Python. Must be called before the rows it selects from are deleted, in
+    the same transaction; the caller commits and then calls FileCleaner.schedule.
+    """
+    from app import db
+    from app.models import CleanupJob, PendingFileDeletion
+
+    job = CleanupJob(description=description, created_by=created_by)
+    db.session.add(job)
+    db.session.flush()
+
+    paths = paths_select.subquery()
+    db.session.execute(
+        db.insert(PendingFileDeletion).from_select(
+            ['job_id', 'path'],
+            db.select(db.literal(job.id), paths.c[0])
+        )
+    )
+    job.total_files = db.session.query(db.func.count(PendingFileDeletion.id)).filter_by(job_id=job.id).scalar()
+    return job
@@ -0,0 +1,180 @@
+"""Per-user activity events pushed to the dashboard over Server-Sent Events.
+
+Publishing is fire-and-forget: a slow or vanished subscriber never blocks the
+request that produced the event. By default events fan out in-process only;
+set EVENTS_REDIS_URL to share them between several workers.
+"""
+import itertools
+import json
+import queue
+import threading
+
+UPLOAD_CREATED = 'upload.created'
+UPLOAD_DOWNLOADED = 'upload.downloaded'
+UPLOAD_EXPIRED = 'upload.expired'
+UPLOAD_DELETED = 'upload.deleted'
+SHARE_LINK_CREATED = 'share_link.created'
+SHARE_LINK_EXPIRED = 'share_link.expired'
+SHARE_LINK_REVOKED = 'share_link.revoked'
+
+
+def format_sse(message):
+    """Render a message dict as one SSE frame"""
+    lines = []
+    if message.get('id') is not None:
+        lines.append(f"id: {message['id']}")
+    lines.append(f"event: {message['event']}")
+    lines.append(f"data: {json.dumps(message['data'], separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """A bounded mailbox for one connected client"""
+
+    def __init__(self, broker, user_id, max_size):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_size)
+        self.dropped = 0
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # The client is not keeping up; it will resync on reconnect.
+            self.dropped += 1
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub keyed by user id"""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event, data):
+        message = {'id': next(self._ids), 'event': event, 'data': data}
+        self._deliver(user_id, message)
+
+    def _deliver(self, user_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+class RedisBroker(LocalBroker):
+    """Relays events through Redis pub/sub so every worker sees them.
+
+    Each worker runs a single listener thread that re-delivers messages to
+    its local subscribers, so the number of Redis connections does not grow
+    with the number of open streams.
+    """
+
+    CHANNEL = 'fileshare:events'
+
+    def __init__(self, url, max_queue_size=100, logger=None):
+        super().__init__(max_queue_size)
+        import redis
+        self.logger = logger
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, event, data):
+        payload = json.dumps({'user_id': user_id, 'event': event, 'data': data})
+        self._redis.publish(self.CHANNEL, payload)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='events-redis-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        try:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(self.CHANNEL)
+            for raw in pubsub.listen():
+                self._handle(raw)
+        except Exception as e:
+            # The next subscribe starts a new listener
+            self._log(f"Event listener stopped: {e}")
+
+    def _handle(self, raw):
+        """Deliver one pub/sub message; a malformed one is logged and skipped"""
+        try:
+            payload = json.loads(raw['data'])
+            message = {'id': next(self._ids), 'event': payload['event'], 'data': payload['data']}
+            self._deliver(payload['user_id'], message)
+        except Exception as e:
+            self._log(f"Dropped malformed event message: {e!r}")
+
+    def _log(self, text):
+        if self.logger is not None:
+            self.logger.error(text)
+
+
+class EventStream:
+    """Flask extension wrapper that picks a broker from the app config"""
+
+    def __init__(self, app=None):
+        self.broker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        max_queue_size = app.config.get('EVENTS_QUEUE_SIZE', 100)
+        redis_url = app.config.get('EVENTS_REDIS_URL')
+        if redis_url:
+            self.broker = RedisBroker(redis_url, max_queue_size, logger=app.logger)
+        else:
+            self.broker = LocalBroker(max_queue_size)
+        app.extensions['events'] = self
+
+    def subscribe(self, user_id):
+        return self.broker.subscribe(user_id)
+
+    def publish(self, user_id, event, data):
+        """Publish an event to a user's streams, never raising into the caller"""
+        if self.broker is None or not user_id:
+            return
+        try:
+            self.broker.publish(user_id, event, data)
+        except Exception as e:
+            from flask import current_app
+            current_app.logger.error(f"Event publish error: {e}")
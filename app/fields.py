@@ -0,0 +1,113 @@
+"""Sparse fieldsets (?fields=a,b,c) for listing endpoints.
+
+When fields are requested, the listing selects only the columns behind them
+and serializes plain rows; otherwise it loads full objects and uses to_dict().
+Either way the output keys and value formats are the same.
+"""
+from datetime import datetime
+
+from app import db
+from app.models import User, FileUpload
+
+
+class FieldSet:
+    """The fields a listing can return and the columns that back them.
+
+    Each field maps to one column, or for nested objects to a dict of
+    sub-field name to column that requires the given join. eager names the
+    relationships to join-load for the full representation.
+    """
+
+    def __init__(self, model, fields, joins=None, eager=None):
+        self.model = model
+        self.fields = fields
+        self.joins = joins or {}
+        self.eager = eager or []
+
+    def parse(self, args):
+        """Return the requested field names, or None for the full representation"""
+        raw = args.get('fields', '').strip()
+        if not raw:
+            return None
+        requested = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+        unknown = [name for name in requested if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.fields)}")
+        return requested
+
+    def query(self, fields):
+        """Start a listing query loading whole objects, or only the requested columns"""
+        if fields is None:
+            query = self.model.query
+            if self.eager:
+                query = query.options(*[db.joinedload(getattr(self.model, name)) for name in self.eager])
+            return query
+
+        columns = []
+        for name in fields:
+            source = self.fields[name]
+            columns.extend(source.values() if isinstance(source, dict) else [source])
+        query = db.session.query(*columns).select_from(self.model)
+        for name in fields:
+            if name in self.joins:
+                target, condition = self.joins[name]
+                query = query.outerjoin(target, condition)
+        return query
+
+    def serialize(self, item, fields):
+        if fields is None:
+            return item.to_dict()
+
+        data = {}
+        values = iter(item)
+        for name in fields:
+            source = self.fields[name]
+            if isinstance(source, dict):
+                nested = {key: to_api_value(next(values)) for key in source}
+                data[name] = nested if any(value is not None for value in nested.values()) else None
+            else:
+                data[name] = to_api_value(next(values))
+        return data
+
+
+def to_api_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+UPLOAD_FIELDS = FieldSet(
+    FileUpload,
+    {
+        'id': FileUpload.id,
+        'original_name': FileUpload.original_name,
+        'size': FileUpload.size,
+        'mime_type': FileUpload.mime_type,
+        'sha256': FileUpload.sha256,
+        'metadata': FileUpload.file_metadata,
+        'metadata_status': FileUpload.metadata_status,
+        'share_token': FileUpload.share_token,
+        'recipient_email': FileUpload.recipient_email,
+        'expires_at': FileUpload.expires_at,
+        'download_count': FileUpload.download_count,
+        'max_downloads': FileUpload.max_downloads,
+        'is_active': FileUpload.is_active,
+        'created_at': FileUpload.created_at,
+        'uploader': {'name': User.name, 'email': User.email}
+    },
+    joins={'uploader': (User, User.id == FileUpload.uploader_id)},
+    eager=['uploader']
+)
+
+USER_FIELDS = FieldSet(
+    User,
+    {
+        'id': User.id,
+        'email': User.email,
+        'name': User.name,
+        'is_admin': User.is_admin,
+        'is_active': User.is_active,
+        'created_at': User.created_at,
+        'updated_at': User.updated_at
+    }
+)
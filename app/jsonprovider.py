@@ -0,0 +1,56 @@
+"""Pluggable JSON provider.
+
+JSON_PROVIDER selects the encoder used by jsonify and request.get_json:
+'orjson' uses orjson, 'default' uses Flask's json-based provider, and
+'auto' (the default) uses orjson when it is installed. Output matches the
+default provider: keys sorted, dates rendered by Flask's default hook.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson-backed provider; falls back to the default one for custom options"""
+
+    def _options(self, indent=False):
+        # Pass datetimes through to Flask's default hook so they render as they do without orjson
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app):
+    choice = app.config.get('JSON_PROVIDER', 'auto')
+    if choice not in ('auto', 'orjson', 'default'):
+        raise ValueError(f"Unknown JSON_PROVIDER: {choice}")
+
+    if choice == 'default' or (choice == 'auto' and orjson is None):
+        return
+    if orjson is None:
+        app.logger.warning("JSON_PROVIDER is 'orjson' but orjson is not installed; using the default provider")
+        return
+
+    app.json = OrjsonProvider(app)
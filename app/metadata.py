@@ -0,0 +1,413 @@
+"""Content type detection and metadata extraction for uploads.
+
+The client's Content-Type is only a claim. Uploads are written through a
+ContentInspector, which sees every chunk once on its way to disk: it keeps
+the first HEAD_SIZE bytes to identify the format from its magic bytes and
+read cheap header fields (image dimensions), and computes the file's
+SHA-256 in the same pass. The detected type replaces the claimed one,
+unless the claim is a more specific type of the same container (a .docx
+is a ZIP) or the content is unrecognised text or binary the claim doesn't
+contradict.
+
+Extractors that need the whole file (PDF page count, ZIP entry count, and
+the digest of a chunked upload, whose parts arrive out of order) run in a
+process pool after the upload is saved; their results are merged into the
+upload's file_metadata and metadata_status goes from 'pending' to 'ready'
+(or 'failed'). METADATA_WORKERS=0 turns the pool off.
+"""
+import gzip
+import hashlib
+import multiprocessing
+import re
+import struct
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from app.storage import COMPRESSED_SUFFIX
+
+HEAD_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+OCTET_STREAM = 'application/octet-stream'
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+# (offset, magic bytes, MIME type); first match wins
+SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'PK\x05\x06', 'application/zip'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (0, b'SQLite format 3\x00', 'application/vnd.sqlite3'),
+    (0, b'\x00asm', 'application/wasm'),
+    (0, b'\x7fELF', 'application/x-executable'),
+    (0, b'MZ', 'application/x-msdownload'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'\x1aE\xdf\xa3', 'video/x-matroska'),
+]
+
+RIFF_TYPES = {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}
+FTYP_BRANDS = {b'qt  ': 'video/quicktime', b'heic': 'image/heic', b'heix': 'image/heic',
+               b'mif1': 'image/heif', b'M4A ': 'audio/mp4', b'avif': 'image/avif'}
+
+# Detected container types whose claimed subtypes are kept (a .docx is sniffed as ZIP)
+REFINABLE = {
+    'application/zip': ('application/vnd.openxmlformats', 'application/vnd.oasis.opendocument',
+                        'application/epub+zip', 'application/java-archive',
+                        'application/vnd.android.package-archive', 'application/x-zip-compressed'),
+    'application/x-ole-storage': ('application/msword', 'application/vnd.ms-', 'application/vnd.visio'),
+    'video/mp4': ('video/', 'audio/mp4', 'image/heif', 'image/heic', 'image/avif'),
+    'video/x-matroska': ('video/webm', 'audio/webm'),
+    'audio/ogg': ('video/ogg', 'application/ogg'),
+    'application/gzip': ('application/x-gzip', 'application/x-tar'),
+}
+
+TEXT_TYPES = ('text/', 'application/json', 'application/xml', 'application/javascript',
+              'application/x-ndjson', 'image/svg+xml')
+
+SNIFFABLE = {mime for _, _, mime in SIGNATURES} | set(RIFF_TYPES.values()) | set(FTYP_BRANDS.values()) | {'video/mp4'}
+
+ZIP_TYPES = ('application/zip',) + REFINABLE['application/zip']
+
+
+def sniff_mime(head):
+    """Identify a file format from its first bytes, or return None"""
+    for offset, magic, mime in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[head[8:12]]
+    if head[4:8] == b'ftyp':
+        return FTYP_BRANDS.get(head[8:12], 'video/mp4')
+    return None
+
+
+def looks_like_text(head):
+    if not head:
+        return False
+    if b'\x00' in head:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the head is fine
+        if e.start < len(head) - 3:
+            return False
+    return True
+
+
+def resolve_mime(detected, declared, is_text):
+    """Pick the type to store from the sniffed type and the client's claim"""
+    declared = (declared or '').split(';')[0].strip().lower()
+    if detected:
+        if declared.startswith(REFINABLE.get(detected, ())):
+            return declared
+        return detected
+    if is_text:
+        return declared if declared.startswith(TEXT_TYPES) else 'text/plain'
+    # Unrecognised binary: keep the claim unless it names a format we would have recognised
+    if declared and declared not in SNIFFABLE and not declared.startswith(TEXT_TYPES):
+        return declared
+    return OCTET_STREAM
+
+
+def image_dimensions(head, mime):
+    """Read width and height from an image header, or return None"""
+    try:
+        if mime == 'image/png' and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if mime == 'image/gif':
+            return struct.unpack('<HH', head[6:10])
+        if mime == 'image/bmp':
+            width, height = struct.unpack('<ii', head[18:26])
+            return width, abs(height)
+        if mime == 'image/webp':
+            chunk = head[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', head[26:30])
+                return width & 0x3fff, height & 0x3fff
+            if chunk == b'VP8L':
+                bits = int.from_bytes(head[21:25], 'little')
+                return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+        if mime == 'image/jpeg':
+            return jpeg_dimensions(head)
+    except struct.error:
+        pass
+    return None
+
+
+def jpeg_dimensions(head):
+    """Walk JPEG segments to the first start-of-frame marker"""
+    position = 2
+    while position + 9 <= len(head):
+        if head[position] != 0xff:
+            return None
+        marker = head[position + 1]
+        if marker == 0xff:
+            position += 1
+            continue
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>HH', head[position + 5:position + 9])
+            return width, height
+        position += 2 + struct.unpack('>H', head[position + 2:position + 4])[0]
+    return None
+
+
+class ContentInspector:
+    """Pipeline stage fed every chunk of an upload as it is written"""
+
+    def __init__(self, digest=True):
+        self._head = bytearray()
+        self._sha256 = hashlib.sha256() if digest else None
+        self.size = 0
+
+    def update(self, chunk):
+        if len(self._head) < HEAD_SIZE:
+            self._head += chunk[:HEAD_SIZE - len(self._head)]
+        if self._sha256 is not None:
+            self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    def result(self, declared_mime=None):
+        """Detected type, digest and header metadata of everything fed so far"""
+        head = bytes(self._head)
+        detected = sniff_mime(head)
+        metadata = {'detected_mime_type': detected}
+        if declared_mime:
+            metadata['declared_mime_type'] = declared_mime
+        mime_type = resolve_mime(detected, declared_mime, detected is None and looks_like_text(head))
+        dimensions = image_dimensions(head, detected)
+        if dimensions:
+            metadata['width'], metadata['height'] = dimensions
+        return {
+            'mime_type': mime_type,
+            'sha256': self._sha256.hexdigest() if self._sha256 is not None else None,
+            'metadata': metadata
+        }
+
+
+def save_stream(stream, path, inspector):
+    """Write an upload stream to path, passing each chunk through the inspector"""
+    with open(path, 'wb') as destination:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            inspector.update(chunk)
+            destination.write(chunk)
+
+
+def inspect_head(path):
+    """Inspect an already-written file's head only; the digest is left to the pool"""
+    inspector = ContentInspector(digest=False)
+    with open(path, 'rb') as f:
+        inspector.update(f.read(HEAD_SIZE))
+    return inspector
+
+
+def open_stored(path):
+    return gzip.open(path, 'rb') if path.endswith(COMPRESSED_SUFFIX) else open(path, 'rb')
+
+
+PDF_PAGE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+PDF_OVERLAP = 64
+
+
+def pdf_page_count(f):
+    """Count page objects in a PDF without loading it whole.
+
+    Only page objects outside compressed object streams are seen, so some
+    PDF 1.5+ files report no count.
+    """
+    count = 0
+    tail = b''
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        data = tail + chunk
+        # Matches starting in the last PDF_OVERLAP bytes are counted with the next chunk
+        limit = len(data) - PDF_OVERLAP if chunk else len(data)
+        count += sum(1 for match in PDF_PAGE.finditer(data) if match.start() < limit)
+        if not chunk:
+            break
+        tail = data[max(limit, 0):]
+    return count or None
+
+
+def zip_summary(f):
+    with zipfile.ZipFile(f) as archive:
+        entries = archive.infolist()
+        return {
+            'entries': len(entries),
+            'uncompressed_size': sum(entry.file_size for entry in entries)
+        }
+
+
+def extract_heavy(path, mime_type, digest):
+    """Run the whole-file extractors for one stored file; executes in a pool process"""
+    metadata = {}
+    sha256 = None
+    if digest:
+        hasher = hashlib.sha256()
+        with open_stored(path) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        sha256 = hasher.hexdigest()
+    if mime_type == 'application/pdf':
+        with open_stored(path) as f:
+            metadata['page_count'] = pdf_page_count(f)
+    elif mime_type.startswith(ZIP_TYPES):
+        with open_stored(path) as f:
+            metadata.update(zip_summary(f))
+    return {'sha256': sha256, 'metadata': metadata}
+
+
+def needs_heavy(mime_type, digest):
+    """Whether extract_heavy has anything to do for this file"""
+    return digest or mime_type == 'application/pdf' or mime_type.startswith(ZIP_TYPES)
+
+
+class MetadataExtractor:
+    """Flask extension running whole-file extractors in a process pool"""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.metrics = {'submitted': 0, 'completed': 0, 'failed': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('METADATA_WORKERS', 2)
+        app.extensions['metadata_extractor'] = self
+
+        @app.cli.command('extract-metadata')
+        @click.option('--limit', type=int, default=None, help='Inspect at most this many uploads.')
+        def extract_metadata_command(limit):
+            """Detect the type and extract metadata of uploads stored before inspection existed, or whose extraction failed."""
+            stats = self.backfill(limit=limit)
+            click.echo(f"Inspected {stats['inspected']} uploads, {stats['errors']} errors")
+
+    @property
+    def enabled(self):
+        return self.max_workers > 0
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the workers must not inherit the web process's threads and sockets
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def apply(self, upload, inspection):
+        """Store an inspection's results on a new upload; returns True if pool work is needed"""
+        upload.mime_type = inspection['mime_type']
+        upload.sha256 = inspection['sha256']
+        upload.file_metadata = inspection['metadata']
+        heavy = self.enabled and needs_heavy(upload.mime_type, upload.sha256 is None)
+        if heavy:
+            upload.metadata_status = PENDING
+        elif upload.sha256 is None:
+            # No pool to hash it (a chunked upload); left for extract-metadata
+            upload.metadata_status = None
+        else:
+            upload.metadata_status = READY
+        return heavy
+
+    def submit(self, upload):
+        """Queue an upload (already committed) for the whole-file extractors"""
+        from flask import current_app
+        app = current_app._get_current_object()
+        upload_id = upload.id
+        future = self.executor.submit(extract_heavy, upload.upload_path, upload.mime_type, upload.sha256 is None)
+        self.metrics['submitted'] += 1
+        future.add_done_callback(lambda f: self._store(app, upload_id, f))
+
+    def _store(self, app, upload_id, future):
+        from app import db
+        from app.models import FileUpload
+        with app.app_context():
+            try:
+                upload = db.session.get(FileUpload, upload_id)
+                if upload is None:
+                    return
+                try:
+                    result = future.result()
+                except Exception as e:
+                    app.logger.error(f"Metadata extraction error for {upload_id}: {e}")
+                    self.metrics['failed'] += 1
+                    upload.metadata_status = FAILED
+                else:
+                    self.metrics['completed'] += 1
+                    upload.file_metadata = {**(upload.file_metadata or {}), **result['metadata']}
+                    if result['sha256']:
+                        upload.sha256 = result['sha256']
+                    upload.metadata_status = READY
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Metadata store error for {upload_id}: {e}")
+
+    def backfill(self, limit=None, batch_size=100):
+        """Inspect uploads with no metadata yet (or whose extraction failed) in this process; must run inside an app context"""
+        from flask import current_app
+        from app import db
+        from app.models import FileUpload
+
+        stats = {'inspected': 0, 'errors': 0}
+        last_id = ''
+        while limit is None or stats['inspected'] < limit:
+            batch = FileUpload.query.filter(
+                db.or_(FileUpload.metadata_status.is_(None), FileUpload.metadata_status == FAILED),
+                FileUpload.id > last_id
+            ).order_by(FileUpload.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for upload in batch:
+                if limit is not None and stats['inspected'] >= limit:
+                    break
+                try:
+                    inspector = ContentInspector()
+                    with open_stored(upload.upload_path) as f:
+                        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                            inspector.update(chunk)
+                    inspection = inspector.result(upload.mime_type)
+                    heavy = extract_heavy(upload.upload_path, inspection['mime_type'], False)
+                    inspection['metadata'].update(heavy['metadata'])
+                    upload.mime_type = inspection['mime_type']
+                    upload.sha256 = inspection['sha256']
+                    upload.file_metadata = inspection['metadata']
+                    upload.metadata_status = READY
+                    db.session.commit()
+                    stats['inspected'] += 1
+                except Exception as e:
+                    db.session.rollback()
+                    stats['errors'] += 1
+                    current_app.logger.error(f"Metadata backfill error for {upload.id}: {e}")
+        return stats
+
+    def stats(self):
+        return {'enabled': self.enabled, 'workers': self.max_workers, **self.metrics}
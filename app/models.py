@@ -10,6 +10,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -30,6 +31,7 @@ class User(db.Model):
             'email': self.email,
             'name': self.name,
             'is_admin': self.is_admin,
+            'is_active': self.is_active,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
@@ -53,11 +55,31 @@ class FileUpload(db.Model):
     download_count = db.Column(db.Integer, default=0)
     max_downloads = db.Column(db.Integer)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    storage_tier = db.Column(db.String(10), default='hot', nullable=False)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Filled in from the file's bytes; see app.metadata
+    sha256 = db.Column(db.String(64))
+    file_metadata = db.Column(db.JSON)
+    metadata_status = db.Column(db.String(10))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign Keys
-    uploader_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    uploader_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    # Share links to this file; share_token above is the link created with the upload
+    links = db.relationship('ShareLink', backref='upload', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # Filter columns for search; sort columns carry id for keyset paging
+    __table_args__ = (
+        db.Index('ix_file_uploads_created_at_id', 'created_at', 'id'),
+        db.Index('ix_file_uploads_size_id', 'size', 'id'),
+        db.Index('ix_file_uploads_original_name_id', 'original_name', 'id'),
+        # Serves type filters alone and, walked in date order, a type filter with the default sort
+        db.Index('ix_file_uploads_mime_type_created_at_id', 'mime_type', 'created_at', 'id'),
+        db.Index('ix_file_uploads_recipient_email', 'recipient_email'),
+        db.Index('ix_file_uploads_tier_last_accessed', 'storage_tier', 'last_accessed_at'),
+    )
     
     def is_expired(self):
         return self.expires_at and datetime.utcnow() > self.expires_at
@@ -71,6 +93,9 @@ class FileUpload(db.Model):
             'original_name': self.original_name,
             'size': self.size,
             'mime_type': self.mime_type,
+            'sha256': self.sha256,
+            'metadata': self.file_metadata,
+            'metadata_status': self.metadata_status,
             'share_token': self.share_token,
             'recipient_email': self.recipient_email,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
@@ -87,6 +112,96 @@ class FileUpload(db.Model):
     def __repr__(self):
         return f'<FileUpload {self.original_name}>'
 
+class ShareLink(db.Model):
+    """A share link to an upload; one stored file can have many"""
+    __tablename__ = 'share_links'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    upload_id = db.Column(db.String(36), db.ForeignKey('file_uploads.id'), nullable=False, index=True)
+    token = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    recipient_email = db.Column(db.String(120))
+    expires_at = db.Column(db.DateTime)
+    download_count = db.Column(db.Integer, default=0, nullable=False)
+    max_downloads = db.Column(db.Integer)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    last_accessed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def is_expired(self):
+        return self.expires_at and datetime.utcnow() > self.expires_at
+    
+    def is_download_limit_reached(self):
+        return self.max_downloads and self.download_count >= self.max_downloads
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'upload_id': self.upload_id,
+            'token': self.token,
+            'recipient_email': self.recipient_email,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'download_count': self.download_count,
+            'max_downloads': self.max_downloads,
+            'is_active': self.is_active,
+            'last_accessed_at': self.last_accessed_at.isoformat() if self.last_accessed_at else None,
+            'created_at': self.created_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<ShareLink {self.token}>'
+
+class UploadSession(db.Model):
+    """A chunked upload in progress; parts are written straight into a preallocated file"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    original_name = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(100))
+    size = db.Column(db.BigInteger, nullable=False)
+    part_size = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    recipient_email = db.Column(db.String(120))
+    expiration_hours = db.Column(db.Integer)
+    max_downloads = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    parts = db.relationship('UploadPart', backref='session', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @property
+    def part_count(self):
+        return -(-self.size // self.part_size)
+    
+    def part_length(self, part_number):
+        return min(self.part_size, self.size - part_number * self.part_size)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'original_name': self.original_name,
+            'size': self.size,
+            'part_size': self.part_size,
+            'part_count': self.part_count,
+            'received_parts': sorted(part.part_number for part in self.parts),
+            'created_at': self.created_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<UploadSession {self.original_name}>'
+
+class UploadPart(db.Model):
+    __tablename__ = 'upload_parts'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    session_id = db.Column(db.String(36), db.ForeignKey('upload_sessions.id'), nullable=False)
+    part_number = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('session_id', 'part_number', name='unique_upload_part'),)
+    
+    def __repr__(self):
+        return f'<UploadPart {self.session_id} #{self.part_number}>'
+
 class ShareAccess(db.Model):
     __tablename__ = 'share_access'
     
@@ -98,4 +213,48 @@ class ShareAccess(db.Model):
     __table_args__ = (db.UniqueConstraint('share_token', 'email', name='unique_share_access'),)
     
     def __repr__(self):
-        return f'<ShareAccess {self.email} -> {self.share_token}>'
\ No newline at end of file
+        return f'<ShareAccess {self.email} -> {self.share_token}>'
+
+class CleanupJob(db.Model):
+    """A background job removing files from disk after a bulk delete"""
+    __tablename__ = 'cleanup_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    description = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    total_files = db.Column(db.Integer, default=0, nullable=False)
+    removed_files = db.Column(db.Integer, default=0, nullable=False)
+    failed_files = db.Column(db.Integer, default=0, nullable=False)
+    created_by = db.Column(db.String(36))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Files still to remove; rows are deleted as files go, which makes jobs resumable
+    pending = db.relationship('PendingFileDeletion', backref='job', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'total_files': self.total_files,
+            'removed_files': self.removed_files,
+            'failed_files': self.failed_files,
+            'remaining_files': max(self.total_files - self.removed_files, 0),
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<CleanupJob {self.id} {self.status}>'
+
+class PendingFileDeletion(db.Model):
+    __tablename__ = 'pending_file_deletions'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    job_id = db.Column(db.String(36), db.ForeignKey('cleanup_jobs.id'), nullable=False, index=True)
+    path = db.Column(db.String(500), nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<PendingFileDeletion {self.path}>'
@@ -0,0 +1,87 @@
+"""Offloading file downloads to the front proxy.
+
+With FILE_OFFLOAD set, download_shared_file still runs every check and
+counts the download, but instead of streaming the file through the worker
+it returns an empty response carrying the file's Content-Type and
+Content-Disposition plus an internal redirect header, and the proxy sends
+the file itself:
+
+* x-accel    - nginx: X-Accel-Redirect to an internal location.
+               UPLOAD_FOLDER maps to X_ACCEL_UPLOADS_LOCATION and
+               COLD_STORAGE_FOLDER to X_ACCEL_COLD_LOCATION.
+* x-sendfile - Apache mod_xsendfile, lighttpd, Caddy: X-Sendfile with the
+               absolute path.
+
+Files the proxy cannot serve as they are (gzip-compressed cold files, or
+paths outside the mapped folders) are still sent by the worker.
+"""
+import os
+from urllib.parse import quote
+
+from flask import current_app, request
+from werkzeug.utils import send_file as send_file_response
+
+from app.storage import COMPRESSED_SUFFIX
+
+OFFLOAD_NONE = 'none'
+OFFLOAD_X_ACCEL = 'x-accel'
+OFFLOAD_X_SENDFILE = 'x-sendfile'
+
+OFFLOAD_MODES = (OFFLOAD_NONE, OFFLOAD_X_ACCEL, OFFLOAD_X_SENDFILE)
+
+
+def init_app(app):
+    mode = app.config.get('FILE_OFFLOAD', OFFLOAD_NONE)
+    if mode not in OFFLOAD_MODES:
+        raise ValueError(f"FILE_OFFLOAD must be one of {', '.join(OFFLOAD_MODES)}, not {mode!r}")
+
+
+def internal_location(path):
+    """Map a stored file to its nginx internal location, or None if no folder covers it"""
+    config = current_app.config
+    mappings = [
+        (config['UPLOAD_FOLDER'], config.get('X_ACCEL_UPLOADS_LOCATION', '/_protected/uploads/')),
+        (config.get('COLD_STORAGE_FOLDER'), config.get('X_ACCEL_COLD_LOCATION', '/_protected/cold/'))
+    ]
+    real_path = os.path.realpath(path)
+    for folder, location in mappings:
+        if not folder:
+            continue
+        folder = os.path.realpath(folder)
+        if os.path.commonpath([folder, real_path]) == folder:
+            relative = os.path.relpath(real_path, folder).replace(os.sep, '/')
+            return location.rstrip('/') + '/' + quote(relative)
+    return None
+
+
+def offload_file(upload):
+    """Build a header-only download response for the proxy, or return None to send from Python"""
+    mode = current_app.config.get('FILE_OFFLOAD', OFFLOAD_NONE)
+    if mode == OFFLOAD_NONE or upload.upload_path.endswith(COMPRESSED_SUFFIX):
+        return None
+
+    location = None
+    if mode == OFFLOAD_X_ACCEL:
+        location = internal_location(upload.upload_path)
+        if location is None:
+            current_app.logger.warning(f"No X-Accel location covers {upload.upload_path}; sending it directly")
+            return None
+
+    # Ranges and conditional requests are left to the proxy, which sees the file
+    response = send_file_response(
+        os.path.abspath(upload.upload_path),
+        request.environ,
+        mimetype=upload.mime_type,
+        as_attachment=True,
+        download_name=upload.original_name,
+        use_x_sendfile=True,
+        conditional=False,
+        etag=False
+    )
+    # The body is empty; the proxy sets the real length
+    response.headers.pop('Content-Length', None)
+
+    if mode == OFFLOAD_X_ACCEL:
+        response.headers.pop('X-Sendfile', None)
+        response.headers['X-Accel-Redirect'] = location
+    return response
@@ -0,0 +1,294 @@
+"""Previews of shared images and PDFs.
+
+GET /share/<token>/preview returns a small JPEG so a recipient can see what
+a file is without downloading it. Images are thumbnailed with Pillow and
+PDFs have their first page rendered with poppler's pdftoppm; both are
+optional, and without them previews are simply unavailable.
+
+Previews are made on first request in a process pool. Concurrent requests
+for the same preview wait on the same job. Finished previews are kept in
+PREVIEW_CACHE_FOLDER, which is trimmed least recently used first to
+PREVIEW_CACHE_MAX_BYTES. Each worker keeps its own index of the folder, so
+the bound holds per worker; a preview another worker made is picked up
+from disk. Previews of deleted uploads can no longer be reached and age
+out of the cache.
+"""
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from app.storage import COMPRESSED_SUFFIX, copy_file, remove_quietly
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+PREVIEW_MIMETYPE = 'image/jpeg'
+PREVIEW_SUFFIX = '.jpg'
+
+IMAGE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff')
+PDF_TYPE = 'application/pdf'
+
+# Most failed previews remembered at once; expired entries are dropped first
+MAX_FAILED_KEYS = 10000
+
+
+class PreviewPending(Exception):
+    """The preview is still being made"""
+
+
+class PreviewFailed(Exception):
+    """The file could not be rendered"""
+
+
+def render_preview(source_path, mime_type, destination, max_size, quality, timeout):
+    """Write a JPEG preview of source_path to destination; runs in a pool process"""
+    with tempfile.TemporaryDirectory(prefix='preview-') as workdir:
+        if source_path.endswith(COMPRESSED_SUFFIX):
+            # Cold-tier files are gzip-compressed; the renderers need the plain file
+            plain_path = os.path.join(workdir, 'source')
+            copy_file(source_path, plain_path, decompress=True)
+            source_path = plain_path
+
+        if mime_type == PDF_TYPE:
+            prefix = os.path.join(workdir, 'page')
+            subprocess.run(
+                ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-png',
+                 '-scale-to', str(max_size * 2), source_path, prefix],
+                check=True, timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            source_path = prefix + '.png'
+
+        with Image.open(source_path) as image:
+            # JPEGs can be decoded at a reduced scale, which is much faster for large photos
+            image.draft('RGB', (max_size, max_size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size))
+            if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            tmp_path = f'{destination}.tmp'
+            try:
+                image.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+                os.replace(tmp_path, destination)
+            except Exception:
+                remove_quietly(tmp_path)
+                raise
+    return os.path.getsize(destination)
+
+
+class PreviewCache:
+    """Size-bounded folder of preview files, evicted least recently used first"""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index the files already in the folder, oldest use first (mtime is bumped on use)"""
+        found = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(PREVIEW_SUFFIX):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-len(PREVIEW_SUFFIX)], stat.st_size))
+                elif entry.is_file() and entry.name.endswith('.tmp'):
+                    remove_quietly(entry.path)
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + PREVIEW_SUFFIX)
+
+    def get(self, key):
+        """Path of a cached preview, marked as just used, or None"""
+        path = self.path(key)
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another worker, or never made
+            if known:
+                with self._lock:
+                    self._bytes -= self._entries.pop(key, 0)
+            self.metrics['misses'] += 1
+            return None
+        if not known:
+            self.add(key, os.path.getsize(path))
+        self.metrics['hits'] += 1
+        return path
+
+    def add(self, key, size):
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used previews until under budget; called with the lock held"""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            remove_quietly(self.path(key))
+            self.metrics['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'files': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes, **self.metrics}
+
+
+class PreviewGenerator:
+    """Flask extension making previews in a process pool, once per file"""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._failed = {}
+        self.cache = None
+        self.metrics = {'rendered': 0, 'failed': 0, 'pending': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PREVIEW_ENABLED', True)
+        self.max_workers = app.config.get('PREVIEW_WORKERS', 2)
+        self.max_size = app.config.get('PREVIEW_MAX_SIZE', 320)
+        self.quality = app.config.get('PREVIEW_QUALITY', 80)
+        self.max_source_bytes = app.config.get('PREVIEW_MAX_SOURCE_BYTES', 50 * 1024 * 1024)
+        self.wait_seconds = app.config.get('PREVIEW_WAIT_SECONDS', 10)
+        self.render_timeout = app.config.get('PREVIEW_RENDER_TIMEOUT', 30)
+        self.failure_ttl = app.config.get('PREVIEW_FAILURE_TTL', 3600)
+        self.pdf_renderer = shutil.which('pdftoppm')
+        if self.enabled and Image is None:
+            app.logger.warning('Pillow is not installed; share previews are disabled')
+            self.enabled = False
+        if self.enabled:
+            folder = app.config.get('PREVIEW_CACHE_FOLDER') or os.path.join(app.config['UPLOAD_FOLDER'], '.previews')
+            self.cache = PreviewCache(folder, app.config.get('PREVIEW_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        app.extensions['preview_generator'] = self
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the workers must not inherit the web process's threads and sockets
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def supports(self, upload):
+        """Whether a preview can be made for this upload"""
+        if not self.enabled or (upload.size or 0) > self.max_source_bytes:
+            return False
+        if upload.mime_type == PDF_TYPE:
+            return self.pdf_renderer is not None
+        return upload.mime_type in IMAGE_TYPES
+
+    def key(self, upload):
+        # Stored files never change, so the upload id names its preview
+        return f'{upload.id}-{self.max_size}'
+
+    def get(self, upload):
+        """Path of the upload's preview, making it if needed.
+
+        Raises PreviewPending if it isn't ready within PREVIEW_WAIT_SECONDS
+        (it keeps being made) and PreviewFailed if it can't be made.
+        """
+        key = self.key(upload)
+        path = self.cache.get(key)
+        if path:
+            return path
+        if self._failed_recently(key):
+            raise PreviewFailed(key)
+
+        executor = self.executor
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = executor.submit(
+                    render_preview, upload.upload_path, upload.mime_type, self.cache.path(key),
+                    self.max_size, self.quality, self.render_timeout
+                )
+                self._inflight[key] = future
+                future.add_done_callback(lambda f: self._finished(key, f))
+
+        try:
+            future.result(timeout=self.wait_seconds)
+        except FutureTimeoutError:
+            self.metrics['pending'] += 1
+            raise PreviewPending(key)
+        except Exception as e:
+            raise PreviewFailed(key) from e
+        return self.cache.path(key)
+
+    def _failed_recently(self, key):
+        with self._lock:
+            failed_at = self._failed.get(key)
+            if failed_at is None:
+                return False
+            if time.monotonic() - failed_at < self.failure_ttl:
+                return True
+            del self._failed[key]
+            return False
+
+    def _finished(self, key, future):
+        try:
+            size = future.result()
+        except subprocess.TimeoutExpired:
+            # Likely a busy machine rather than a bad file; the next request tries again
+            self.metrics['failed'] += 1
+        except Exception as e:
+            self.metrics['failed'] += 1
+            now = time.monotonic()
+            with self._lock:
+                if isinstance(e, BrokenExecutor):
+                    # A worker died (e.g. killed for memory); start a fresh pool next time
+                    self._executor = None
+                if len(self._failed) >= MAX_FAILED_KEYS:
+                    self._failed = {k: t for k, t in self._failed.items() if now - t < self.failure_ttl}
+                    if len(self._failed) >= MAX_FAILED_KEYS:
+                        self._failed.clear()
+                self._failed[key] = now
+        else:
+            self.metrics['rendered'] += 1
+            self.cache.add(key, size)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._inflight)
+        return {
+            'enabled': self.enabled,
+            'pdf': self.pdf_renderer is not None,
+            'workers': self.max_workers,
+            'in_progress': inflight,
+            **self.metrics,
+            'cache': self.cache.stats() if self.cache is not None else None
+        }
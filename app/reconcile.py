@@ -0,0 +1,232 @@
+"""Reconciliation between the storage folders and the file_uploads table.
+
+Finds three kinds of inconsistencies:
+
+* orphan_file  - a file on disk with no row (e.g. a crash between writing
+                 the file and committing the row)
+* stale_file   - a file whose row is inactive (delete_upload failed to
+                 remove it)
+* missing_file - an active row whose file no longer exists
+
+Both sides are streamed in sorted order and merge-joined, so memory stays
+bounded regardless of the number of files (hidden directories, such as the
+staging folder of chunked uploads, are skipped): the folders are listed in
+parallel with os.scandir into sorted runs spilled to temporary files, and
+rows are read in keyset batches ordered by upload_path.
+
+Every finding is re-checked right before it is reported or fixed, and files
+younger than the grace period are ignored, so the command is safe to run
+while uploads, deletes and tiering moves are in progress.
+"""
+import heapq
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from sqlalchemy import DDL, event
+
+from app import db
+from app.models import FileUpload
+from app.storage import COMPRESSED_SUFFIX
+
+ORPHAN_FILE = 'orphan_file'
+STALE_FILE = 'stale_file'
+MISSING_FILE = 'missing_file'
+
+# The merge-join needs the database to sort paths byte-wise, like Python does
+UPLOAD_PATH_INDEX_DDL = {
+    'sqlite': 'CREATE INDEX IF NOT EXISTS ix_file_uploads_upload_path ON file_uploads (upload_path)',
+    'postgresql': 'CREATE INDEX IF NOT EXISTS ix_file_uploads_upload_path ON file_uploads (upload_path COLLATE "C")'
+}
+
+for dialect, statement in UPLOAD_PATH_INDEX_DDL.items():
+    event.listen(FileUpload.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+
+def scan_directory(path, run_size, tmp_dir):
+    """List one directory into sorted run files; returns (run paths, subdirectories)"""
+    runs, subdirs, names = [], [], []
+
+    def spill():
+        names.sort()
+        fd, run_path = tempfile.mkstemp(dir=tmp_dir, suffix='.run')
+        with os.fdopen(fd, 'w', encoding='utf-8', errors='surrogateescape') as run:
+            for name in names:
+                run.write(name + '\n')
+        runs.append(run_path)
+        names.clear()
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('.'):
+                    subdirs.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and '\n' not in entry.path:
+                names.append(entry.path)
+                if len(names) >= run_size:
+                    spill()
+    if names:
+        spill()
+    return runs, subdirs
+
+
+def read_run(run_path):
+    with open(run_path, encoding='utf-8', errors='surrogateescape') as run:
+        for line in run:
+            yield line[:-1]
+
+
+def iter_disk_paths(roots, workers, run_size, tmp_dir):
+    """Yield every file path under roots in sorted order"""
+    runs = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile-scan') as executor:
+        pending = [executor.submit(scan_directory, root, run_size, tmp_dir) for root in roots if os.path.isdir(root)]
+        while pending:
+            future = pending.pop()
+            dir_runs, subdirs = future.result()
+            runs.extend(dir_runs)
+            pending.extend(executor.submit(scan_directory, subdir, run_size, tmp_dir) for subdir in subdirs)
+    return heapq.merge(*[read_run(run) for run in runs])
+
+
+def iter_db_rows(batch_size):
+    """Yield (upload_path, id, is_active) for every upload, ordered byte-wise by path"""
+    path_column = FileUpload.upload_path
+    if db.engine.dialect.name == 'postgresql':
+        path_column = path_column.collate('C')
+
+    last_path = None
+    while True:
+        query = db.session.query(FileUpload.upload_path, FileUpload.id, FileUpload.is_active)
+        if last_path is not None:
+            query = query.filter(path_column > last_path)
+        rows = query.order_by(path_column).limit(batch_size).all()
+        # Keep each read transaction short on a live system
+        db.session.rollback()
+        if not rows:
+            return
+        yield from rows
+        last_path = rows[-1].upload_path
+
+
+def merge_join(disk_paths, db_rows):
+    """Yield (kind, path, row) for paths present on only one side or with an inactive row"""
+    disk_paths = iter(disk_paths)
+    db_rows = iter(db_rows)
+    path = next(disk_paths, None)
+    row = next(db_rows, None)
+    while path is not None or row is not None:
+        if row is None or (path is not None and path < row.upload_path):
+            yield ORPHAN_FILE, path, None
+            path = next(disk_paths, None)
+        elif path is None or row.upload_path < path:
+            if row.is_active:
+                yield MISSING_FILE, row.upload_path, row
+            row = next(db_rows, None)
+        else:
+            if not row.is_active:
+                yield STALE_FILE, path, row
+            path = next(disk_paths, None)
+            row = next(db_rows, None)
+
+
+def confirm(kind, path, row, grace_seconds):
+    """Re-check a finding against the current state of disk and database"""
+    if kind == MISSING_FILE:
+        if os.path.exists(path):
+            return False
+        current = db.session.query(FileUpload.upload_path, FileUpload.is_active).filter_by(id=row.id).first()
+        db.session.rollback()
+        return bool(current and current.is_active and current.upload_path == path)
+
+    try:
+        if time.time() - os.stat(path).st_mtime < grace_seconds:
+            return False
+    except FileNotFoundError:
+        return False
+
+    if kind == STALE_FILE:
+        current = db.session.query(FileUpload.is_active).filter_by(upload_path=path).first()
+        db.session.rollback()
+        return current is not None and not current.is_active
+
+    # Also match by stored filename, so rows with differently spelled paths
+    # (or a cold-tier .gz copy) still protect their file
+    name = os.path.basename(path)
+    names = {name, name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name}
+    owners = db.session.query(FileUpload.upload_path).filter(
+        db.or_(FileUpload.upload_path == path, FileUpload.filename.in_(names))
+    ).all()
+    db.session.rollback()
+    # A leftover copy from an interrupted tiering move is an orphan once its
+    # row's own file is confirmed to be where the row says
+    return all(owner.upload_path != path and os.path.exists(owner.upload_path) for owner in owners)
+
+
+def fix(kind, path, row):
+    if kind == MISSING_FILE:
+        # Deactivate like delete_upload does, but only if nothing changed meanwhile
+        db.session.execute(
+            db.update(FileUpload)
+            .where(FileUpload.id == row.id, FileUpload.upload_path == path, FileUpload.is_active.is_(True))
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    else:
+        os.remove(path)
+
+
+def reconcile(roots, apply_fixes=False, workers=4, batch_size=1000, run_size=100000,
+              grace_seconds=3600, on_finding=None):
+    """Compare the files under roots with the database; must run inside an app context"""
+    stats = {ORPHAN_FILE: 0, STALE_FILE: 0, MISSING_FILE: 0, 'fixed': 0, 'errors': 0}
+    with tempfile.TemporaryDirectory(prefix='reconcile-') as tmp_dir:
+        disk_paths = iter_disk_paths(roots, workers, run_size, tmp_dir)
+        for kind, path, row in merge_join(disk_paths, iter_db_rows(batch_size)):
+            if not confirm(kind, path, row, grace_seconds):
+                continue
+            stats[kind] += 1
+            fixed = False
+            if apply_fixes:
+                try:
+                    fix(kind, path, row)
+                    fixed = True
+                    stats['fixed'] += 1
+                except Exception:
+                    db.session.rollback()
+                    stats['errors'] += 1
+            if on_finding:
+                on_finding({'kind': kind, 'path': path, 'upload_id': row.id if row else None, 'fixed': fixed})
+    return stats
+
+
+def init_app(app):
+    @app.cli.command('reconcile')
+    @click.option('--fix', 'apply_fixes', is_flag=True,
+                  help='Delete orphan and stale files and deactivate rows whose file is missing.')
+    @click.option('--workers', type=int, default=4, show_default=True, help='Parallel directory scanners.')
+    @click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows read per query.')
+    @click.option('--grace', 'grace_seconds', type=int, default=3600, show_default=True,
+                  help='Ignore files modified more recently than this many seconds.')
+    @click.option('--report', type=click.File('w'), help='Write every finding to this file as NDJSON.')
+    def reconcile_command(apply_fixes, workers, batch_size, grace_seconds, report):
+        """Find (and optionally fix) files without rows and rows without files."""
+        roots = [app.config['UPLOAD_FOLDER']]
+        if app.config.get('COLD_STORAGE_FOLDER'):
+            roots.append(app.config['COLD_STORAGE_FOLDER'])
+
+        def on_finding(finding):
+            if report:
+                report.write(json.dumps(finding) + '\n')
+
+        stats = reconcile(roots, apply_fixes, workers, batch_size, grace_seconds=grace_seconds,
+                          on_finding=on_finding)
+        click.echo(
+            f"Orphan files: {stats[ORPHAN_FILE]}, stale files: {stats[STALE_FILE]}, "
+            f"missing files: {stats[MISSING_FILE]}"
+            + (f", fixed: {stats['fixed']}, errors: {stats['errors']}" if apply_fixes else '')
+        )
@@ -0,0 +1,243 @@
+"""Upload search: full-text matching, combinable filters and keyset paging.
+
+Full-text search uses an FTS5 table on SQLite and an expression GIN index
+over a tsvector on PostgreSQL, both covering original_name and
+recipient_email. Other databases fall back to LIKE matching.
+
+Names and addresses are split into words at every character that is not a
+letter or digit, the way FTS5's unicode61 tokenizer does, so invoice_march.pdf
+and user7@corp.io match "pdf" or "corp" on both databases (PostgreSQL's
+'simple' parser alone would keep them whole).
+"""
+import base64
+import json
+import re
+from datetime import datetime
+
+import click
+from sqlalchemy import DDL, event
+
+from app import db
+from app.models import FileUpload
+
+SORT_COLUMNS = {
+    'created_at': FileUpload.created_at,
+    'size': FileUpload.size,
+    'name': FileUpload.original_name
+}
+
+MAX_QUERY_TERMS = 8
+
+# On SQLite, a search matching at least this many rows walks the sort index
+# and checks rows against the matches; fewer matches are fetched and sorted
+SQLITE_COMMON_MATCHES = 5000
+
+# Kept identical to the indexed expression so PostgreSQL can use the GIN index
+PG_SEARCH_VECTOR = (
+    "to_tsvector('simple', regexp_replace("
+    "coalesce(original_name, '') || ' ' || coalesce(recipient_email, ''), '[^[:alnum:]]+', ' ', 'g'))"
+)
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS file_uploads_fts USING fts5(
+        original_name, recipient_email, content='file_uploads', content_rowid='rowid'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS file_uploads_fts_insert AFTER INSERT ON file_uploads BEGIN
+        INSERT INTO file_uploads_fts(rowid, original_name, recipient_email)
+        VALUES (new.rowid, new.original_name, new.recipient_email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_uploads_fts_delete AFTER DELETE ON file_uploads BEGIN
+        INSERT INTO file_uploads_fts(file_uploads_fts, rowid, original_name, recipient_email)
+        VALUES ('delete', old.rowid, old.original_name, old.recipient_email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_uploads_fts_update AFTER UPDATE OF original_name, recipient_email ON file_uploads BEGIN
+        INSERT INTO file_uploads_fts(file_uploads_fts, rowid, original_name, recipient_email)
+        VALUES ('delete', old.rowid, old.original_name, old.recipient_email);
+        INSERT INTO file_uploads_fts(rowid, original_name, recipient_email)
+        VALUES (new.rowid, new.original_name, new.recipient_email);
+    END"""
+]
+
+POSTGRES_FTS_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_file_uploads_search_words ON file_uploads USING gin ({PG_SEARCH_VECTOR})"
+]
+# Earlier indexes over a different expression, which queries no longer use
+POSTGRES_FTS_OBSOLETE = ['DROP INDEX IF EXISTS ix_file_uploads_search']
+
+# Create the full-text structures together with the table on fresh databases
+for statement in SQLITE_FTS_DDL:
+    event.listen(FileUpload.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_FTS_DDL:
+    event.listen(FileUpload.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def install_fulltext_index(rebuild=True):
+    """Create the full-text index on an existing database and fill it"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            db.session.execute(db.text(statement))
+        if rebuild:
+            db.session.execute(db.text("INSERT INTO file_uploads_fts(file_uploads_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_FTS_DDL + POSTGRES_FTS_OBSOLETE:
+            db.session.execute(db.text(statement))
+    db.session.commit()
+    return dialect
+
+
+def init_app(app):
+    @app.cli.command('search-index')
+    @click.option('--no-rebuild', is_flag=True, help='Only create the index, do not repopulate it.')
+    def search_index_command(no_rebuild):
+        """Create (and rebuild) the upload full-text search index."""
+        dialect = install_fulltext_index(rebuild=not no_rebuild)
+        click.echo(f'Search index ready ({dialect})')
+
+
+def query_terms(text):
+    """Split free text into at most MAX_QUERY_TERMS lowercase letter-and-digit tokens, as names are indexed"""
+    return re.findall(r'[^\W_]+', text.lower())[:MAX_QUERY_TERMS]
+
+
+def fulltext_filter(text):
+    """Return a clause matching uploads whose name or recipient contains all terms as prefixes"""
+    terms = query_terms(text)
+    if not terms:
+        return None
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        common = db.session.execute(
+            db.text('SELECT count(*) FROM (SELECT 1 FROM file_uploads_fts WHERE file_uploads_fts MATCH :fts_match '
+                    'LIMIT :limit)'),
+            {'fts_match': match, 'limit': SQLITE_COMMON_MATCHES}
+        ).scalar() >= SQLITE_COMMON_MATCHES
+        # Unary + stops SQLite from looking every match up by rowid and sorting them all
+        rowid = '+file_uploads.rowid' if common else 'file_uploads.rowid'
+        return db.text(
+            f'{rowid} IN (SELECT rowid FROM file_uploads_fts WHERE file_uploads_fts MATCH :fts_match)'
+        ).bindparams(fts_match=match)
+    if dialect == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return db.text(
+            f"{PG_SEARCH_VECTOR} @@ to_tsquery('simple', :fts_match)"
+        ).bindparams(fts_match=tsquery)
+
+    return db.and_(*[
+        db.or_(FileUpload.original_name.ilike(f'%{term}%'), FileUpload.recipient_email.ilike(f'%{term}%'))
+        for term in terms
+    ])
+
+
+def encode_cursor(sort, upload):
+    value = getattr(upload, SORT_COLUMNS[sort].key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, upload.id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, upload_id = json.loads(raw)
+        if sort == 'created_at':
+            value = datetime.fromisoformat(value)
+        elif sort == 'size':
+            value = int(value)
+        else:
+            value = str(value)
+        return value, str(upload_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_datetime(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 date')
+
+
+def filter_uploads(args, query):
+    """Apply the upload listing filters from request args to a query.
+
+    Supported args: q, mime_type (exact, or a "type/" prefix), recipient,
+    min_size, max_size, created_after, created_before and is_active.
+    Raises ValueError for invalid arguments.
+    """
+    if args.get('q'):
+        clause = fulltext_filter(args['q'])
+        if clause is not None:
+            query = query.filter(clause)
+
+    mime_type = args.get('mime_type', '').strip().lower()
+    if mime_type.endswith('/'):
+        query = query.filter(FileUpload.mime_type.startswith(mime_type))
+    elif mime_type:
+        query = query.filter(FileUpload.mime_type == mime_type)
+
+    recipient = args.get('recipient', '').strip()
+    if recipient:
+        query = query.filter(FileUpload.recipient_email == recipient)
+
+    min_size = args.get('min_size', type=int)
+    if min_size is not None:
+        query = query.filter(FileUpload.size >= min_size)
+    max_size = args.get('max_size', type=int)
+    if max_size is not None:
+        query = query.filter(FileUpload.size <= max_size)
+
+    if args.get('created_after'):
+        query = query.filter(FileUpload.created_at >= parse_datetime(args['created_after'], 'created_after'))
+    if args.get('created_before'):
+        query = query.filter(FileUpload.created_at < parse_datetime(args['created_before'], 'created_before'))
+
+    is_active = args.get('is_active')
+    if is_active is not None:
+        query = query.filter(FileUpload.is_active.is_(is_active.lower() in ['true', '1']))
+
+    return query
+
+
+def search_uploads(args, query=None, max_limit=100):
+    """Run an upload search from request args.
+
+    Takes the filter_uploads args plus sort (created_at|size|name),
+    order (asc|desc), limit and cursor. Raises ValueError for invalid arguments.
+    """
+    if query is None:
+        query = FileUpload.query
+
+    query = filter_uploads(args, query)
+
+    sort = args.get('sort', 'created_at')
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_COLUMNS)}")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+
+    column = SORT_COLUMNS[sort]
+    key = db.tuple_(column, FileUpload.id)
+    if args.get('cursor'):
+        value, upload_id = decode_cursor(sort, args['cursor'])
+        bound = db.tuple_(db.literal(value, column.type), db.literal(upload_id))
+        query = query.filter(key < bound if order == 'desc' else key > bound)
+
+    if order == 'desc':
+        query = query.order_by(column.desc(), FileUpload.id.desc())
+    else:
+        query = query.order_by(column.asc(), FileUpload.id.asc())
+
+    limit = max(1, min(args.get('limit', 20, type=int), max_limit))
+    rows = query.options(db.joinedload(FileUpload.uploader)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1])
+
+    return rows, next_cursor
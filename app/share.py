@@ -1,25 +1,50 @@
 from flask import Blueprint, request, jsonify, send_file, current_app
-from app import db
-from app.models import FileUpload, ShareAccess
+from app import db, events, token_filter, tiering, previews
+from app.events import UPLOAD_DOWNLOADED, UPLOAD_EXPIRED, SHARE_LINK_EXPIRED
+from app.models import FileUpload, ShareLink, ShareAccess
+from app.offload import offload_file
+from app.preview import PreviewPending, PreviewFailed, PREVIEW_MIMETYPE
+from app.storage import COLD
+from app.tracing import span
 import os
 from datetime import datetime
 
 bp = Blueprint('share', __name__)
 
+def get_active_link(share_token):
+    """Find an active share link together with its (active) upload"""
+    with span('share.lookup'):
+        return ShareLink.query.join(ShareLink.upload).options(db.contains_eager(ShareLink.upload)).filter(
+            ShareLink.token == share_token,
+            ShareLink.is_active.is_(True),
+            FileUpload.is_active.is_(True)
+        ).first()
+
+def publish_link_expired(link, reason):
+    upload = link.upload
+    events.publish(upload.uploader_id, SHARE_LINK_EXPIRED, {'id': upload.id, 'link_id': link.id, 'reason': reason})
+    # The link created with the upload is the one the upload's own fields describe
+    if link.token == upload.share_token:
+        events.publish(upload.uploader_id, UPLOAD_EXPIRED, {'id': upload.id, 'reason': reason})
+
 @bp.route('/<share_token>/info', methods=['GET'])
 def get_share_info(share_token):
     """Get information about a shared file without downloading it"""
     try:
-        upload = FileUpload.query.filter_by(
-            share_token=share_token,
-            is_active=True
-        ).first()
+        # Reject unknown tokens without touching the database
+        if not token_filter.might_exist(share_token):
+            return jsonify({'error': 'File not found'}), 404
+        
+        link = get_active_link(share_token)
         
-        if not upload:
+        if not link:
+            token_filter.record_false_positive()
             return jsonify({'error': 'File not found'}), 404
         
-        # Check if file has expired
-        if upload.is_expired():
+        upload = link.upload
+        
+        # Check if the link has expired
+        if link.is_expired():
             return jsonify({'error': 'Share link has expired'}), 410
         
         # Don't reveal recipient email in public info
@@ -28,10 +53,11 @@ def get_share_info(share_token):
             'original_name': upload.original_name,
             'size': upload.size,
             'mime_type': upload.mime_type,
-            'expires_at': upload.expires_at.isoformat() if upload.expires_at else None,
-            'download_count': upload.download_count,
-            'max_downloads': upload.max_downloads,
-            'has_recipient_restriction': bool(upload.recipient_email),
+            'expires_at': link.expires_at.isoformat() if link.expires_at else None,
+            'download_count': link.download_count,
+            'max_downloads': link.max_downloads,
+            'has_recipient_restriction': bool(link.recipient_email),
+            'has_preview': previews.supports(upload),
             'created_at': upload.created_at.isoformat(),
             'uploader_name': upload.uploader.name
         }
@@ -42,30 +68,98 @@ def get_share_info(share_token):
         current_app.logger.error(f"Share info error: {e}")
         return jsonify({'error': 'Failed to get file info'}), 500
 
+@bp.route('/<share_token>/preview', methods=['GET'])
+def get_share_preview(share_token):
+    """Get a small JPEG preview of a shared image or PDF; doesn't count as a download"""
+    try:
+        user_email = request.args.get('email', '').strip()
+        
+        # Reject unknown tokens without touching the database
+        if not token_filter.might_exist(share_token):
+            return jsonify({'error': 'File not found or link expired'}), 404
+        
+        link = get_active_link(share_token)
+        
+        if not link:
+            token_filter.record_false_positive()
+            return jsonify({'error': 'File not found or link expired'}), 404
+        
+        upload = link.upload
+        
+        # The same checks as a download, without counting one
+        if link.is_expired():
+            return jsonify({'error': 'Share link has expired'}), 410
+        
+        if link.is_download_limit_reached():
+            return jsonify({'error': 'Download limit reached'}), 410
+        
+        if link.recipient_email and link.recipient_email != user_email:
+            return jsonify({
+                'error': 'Access denied. This file is shared with a specific recipient.',
+                'requires_email': True
+            }), 403
+        
+        if not previews.supports(upload):
+            return jsonify({'error': 'No preview available for this file'}), 404
+        
+        try:
+            with span('share.preview'):
+                path = previews.get(upload)
+        except PreviewPending:
+            response = jsonify({'error': 'Preview is being generated'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '2'
+            return response
+        except PreviewFailed:
+            return jsonify({'error': 'No preview available for this file'}), 404
+        
+        # Cached copies must not outlive the link
+        max_age = current_app.config.get('PREVIEW_MAX_AGE', 3600)
+        if link.expires_at:
+            max_age = max(min(max_age, int((link.expires_at - datetime.utcnow()).total_seconds())), 0)
+        
+        response = send_file(path, mimetype=PREVIEW_MIMETYPE, etag=previews.key(upload), max_age=max_age)
+        # Previews of restricted links stay out of shared caches
+        if link.recipient_email or link.max_downloads:
+            response.cache_control.public = False
+            response.cache_control.private = True
+        else:
+            response.cache_control.public = True
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f"Share preview error: {e}")
+        return jsonify({'error': 'Failed to get preview'}), 500
+
 @bp.route('/<share_token>', methods=['GET'])
 def download_shared_file(share_token):
     """Download a shared file"""
     try:
         user_email = request.args.get('email', '').strip()
         
-        upload = FileUpload.query.filter_by(
-            share_token=share_token,
-            is_active=True
-        ).first()
+        # Reject unknown tokens without touching the database
+        if not token_filter.might_exist(share_token):
+            return jsonify({'error': 'File not found or link expired'}), 404
         
-        if not upload:
+        link = get_active_link(share_token)
+        
+        if not link:
+            token_filter.record_false_positive()
             return jsonify({'error': 'File not found or link expired'}), 404
         
-        # Check if file has expired
-        if upload.is_expired():
+        upload = link.upload
+        
+        # Check if the link has expired
+        if link.is_expired():
+            publish_link_expired(link, 'expired')
             return jsonify({'error': 'Share link has expired'}), 410
         
         # Check download limit
-        if upload.is_download_limit_reached():
+        if link.is_download_limit_reached():
             return jsonify({'error': 'Download limit reached'}), 410
         
         # Check if specific recipient email is required
-        if upload.recipient_email and upload.recipient_email != user_email:
+        if link.recipient_email and link.recipient_email != user_email:
             return jsonify({
                 'error': 'Access denied. This file is shared with a specific recipient.',
                 'requires_email': True
@@ -76,29 +170,58 @@ def download_shared_file(share_token):
             return jsonify({'error': 'File not found on server'}), 404
         
         # Log access if email is provided
-        if user_email and upload.recipient_email:
+        if user_email and link.recipient_email:
             try:
-                share_access = ShareAccess.query.filter_by(
-                    share_token=share_token,
-                    email=user_email
-                ).first()
-                
-                if share_access:
-                    share_access.accessed_at = datetime.utcnow()
-                else:
-                    share_access = ShareAccess(
+                with span('share.log_access'):
+                    share_access = ShareAccess.query.filter_by(
                         share_token=share_token,
                         email=user_email
-                    )
-                    db.session.add(share_access)
-                
-                db.session.commit()
+                    ).first()
+                    
+                    if share_access:
+                        share_access.accessed_at = datetime.utcnow()
+                    else:
+                        share_access = ShareAccess(
+                            share_token=share_token,
+                            email=user_email
+                        )
+                        db.session.add(share_access)
+                    
+                    db.session.commit()
             except Exception as log_error:
                 current_app.logger.error(f"Access logging error: {log_error}")
         
-        # Increment download count
-        upload.download_count += 1
-        db.session.commit()
+        # Increment download counts; the upload row describes its original link,
+        # so its count (shown against its max_downloads) is that link's only
+        now = datetime.utcnow()
+        link.download_count += 1
+        link.last_accessed_at = now
+        if link.token == upload.share_token:
+            upload.download_count += 1
+        upload.last_accessed_at = now
+        with span('db.commit'):
+            db.session.commit()
+        
+        events.publish(upload.uploader_id, UPLOAD_DOWNLOADED, {
+            'id': upload.id,
+            'link_id': link.id,
+            'download_count': upload.download_count,
+            'link_download_count': link.download_count,
+            'email': user_email or None
+        })
+        if link.is_download_limit_reached():
+            publish_link_expired(link, 'download_limit')
+        
+        # Let the front proxy send the file when offloading is configured
+        response = offload_file(upload)
+        if response is not None:
+            if upload.storage_tier == COLD:
+                tiering.promote_async(upload.id, delay=current_app.config.get('OFFLOAD_PROMOTE_DELAY', 30))
+            return response
+        
+        # Cold files stream from the cold tier while being promoted back
+        if upload.storage_tier == COLD:
+            return tiering.send(upload)
         
         # Send file
         return send_file(
@@ -0,0 +1,266 @@
+"""Hot/cold storage tiering for uploaded files.
+
+New uploads live in UPLOAD_FOLDER (the hot tier). The tiering job moves
+files that have not been downloaded for STORAGE_COLD_AFTER_DAYS to
+COLD_STORAGE_FOLDER, optionally gzip-compressed. A download of a cold file
+streams it straight from the cold tier while a background thread promotes
+it back to the hot tier.
+
+Moves copy first, then switch the row's upload_path with an UPDATE guarded
+on the old path, then remove the source, so a crash or a concurrent delete
+can at worst leave an extra copy behind, never a row without its file.
+"""
+import gzip
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import send_file
+
+HOT = 'hot'
+COLD = 'cold'
+
+COMPRESSED_SUFFIX = '.gz'
+
+
+def copy_file(source, destination, compress=False, decompress=False):
+    """Copy source to destination atomically, gzip-compressing or decompressing on the way"""
+    tmp_path = f'{destination}.tmp'
+    opener = gzip.open if decompress else open
+    writer = gzip.open if compress else open
+    try:
+        with opener(source, 'rb') as src, writer(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_path, destination)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def switch_path(upload_id, old_path, new_path, tier):
+    """Point an upload at its new location, unless it was changed or deleted meanwhile"""
+    from app import db
+    from app.models import FileUpload
+
+    updated = db.session.execute(
+        db.update(FileUpload)
+        .where(FileUpload.id == upload_id, FileUpload.upload_path == old_path)
+        .values(upload_path=new_path, storage_tier=tier)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(updated)
+
+
+class StorageTiering:
+    """Flask extension running demotions and on-demand promotions"""
+
+    def __init__(self, app=None):
+        self._promoting = set()
+        self._lock = threading.Lock()
+        self._running = False
+        self.last_run = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cold_folder = app.config.get('COLD_STORAGE_FOLDER')
+        self.compress = app.config.get('COLD_STORAGE_COMPRESS', False)
+        self.cold_after = timedelta(days=app.config.get('STORAGE_COLD_AFTER_DAYS', 30))
+        self.min_size = app.config.get('STORAGE_COLD_MIN_SIZE', 64 * 1024)
+        self.batch_size = app.config.get('STORAGE_TIER_BATCH_SIZE', 200)
+        if self.cold_folder:
+            os.makedirs(self.cold_folder, exist_ok=True)
+        app.extensions['storage_tiering'] = self
+
+        @app.cli.command('storage-tier')
+        @click.option('--limit', type=int, default=None, help='Move at most this many files.')
+        def storage_tier_command(limit):
+            """Move files not downloaded recently to the cold storage tier."""
+            if not self.cold_folder:
+                raise click.ClickException('COLD_STORAGE_FOLDER is not configured')
+            stats = self.run(limit=limit)
+            click.echo(f"Moved {stats['demoted']} files ({stats['bytes']} bytes) to cold storage, "
+                       f"{stats['errors']} errors")
+
+    @property
+    def enabled(self):
+        return bool(self.cold_folder)
+
+    def is_running(self):
+        return self._running
+
+    def run(self, limit=None):
+        """Demote cold files in batches; must run inside an app context"""
+        from flask import current_app
+        from app import db
+        from app.models import FileUpload
+
+        with self._lock:
+            if self._running:
+                raise RuntimeError('Tiering is already running')
+            self._running = True
+
+        stats = {'demoted': 0, 'bytes': 0, 'stored_bytes': 0, 'errors': 0,
+                 'started_at': datetime.utcnow().isoformat(), 'finished_at': None}
+        try:
+            cutoff = datetime.utcnow() - self.cold_after
+            last_key = None
+            while limit is None or stats['demoted'] < limit:
+                query = db.session.query(
+                    FileUpload.id, FileUpload.filename, FileUpload.upload_path, FileUpload.size,
+                    FileUpload.last_accessed_at
+                ).filter(
+                    FileUpload.storage_tier == HOT,
+                    FileUpload.is_active.is_(True),
+                    FileUpload.last_accessed_at < cutoff,
+                    FileUpload.size >= self.min_size
+                )
+                if last_key is not None:
+                    query = query.filter(db.tuple_(FileUpload.last_accessed_at, FileUpload.id) > last_key)
+                batch = query.order_by(FileUpload.last_accessed_at, FileUpload.id).limit(self.batch_size).all()
+                db.session.rollback()
+                if not batch:
+                    break
+                last_key = (batch[-1].last_accessed_at, batch[-1].id)
+
+                for row in batch:
+                    if limit is not None and stats['demoted'] >= limit:
+                        break
+                    try:
+                        stored = self.demote(row)
+                    except Exception as e:
+                        db.session.rollback()
+                        stats['errors'] += 1
+                        current_app.logger.error(f"Tiering error for {row.id}: {e}")
+                        continue
+                    if stored is not None:
+                        stats['demoted'] += 1
+                        stats['bytes'] += row.size
+                        stats['stored_bytes'] += stored
+        finally:
+            stats['finished_at'] = datetime.utcnow().isoformat()
+            self.last_run = stats
+            self._running = False
+        return stats
+
+    def run_async(self):
+        """Start a tiering run in a background thread; returns False if one is running"""
+        from flask import current_app
+        if self._running:
+            return False
+        app = current_app._get_current_object()
+
+        def target():
+            with app.app_context():
+                try:
+                    self.run()
+                except Exception as e:
+                    app.logger.error(f"Tiering run failed: {e}")
+
+        threading.Thread(target=target, name='storage-tiering', daemon=True).start()
+        return True
+
+    def demote(self, row):
+        """Move one file to the cold tier; returns the bytes stored there, or None if skipped"""
+        cold_path = os.path.join(self.cold_folder, row.filename + (COMPRESSED_SUFFIX if self.compress else ''))
+        copy_file(row.upload_path, cold_path, compress=self.compress)
+        stored = os.path.getsize(cold_path)
+        if not switch_path(row.id, row.upload_path, cold_path, COLD):
+            remove_quietly(cold_path)
+            return None
+        remove_quietly(row.upload_path)
+        return stored
+
+    def promote_async(self, upload_id, delay=0):
+        """Copy a cold file back to the hot tier in the background (once per upload).
+
+        delay postpones the move, e.g. so a proxy that was just told to send
+        the cold copy has opened it before it is removed.
+        """
+        from flask import current_app
+        with self._lock:
+            if upload_id in self._promoting:
+                return
+            self._promoting.add(upload_id)
+        app = current_app._get_current_object()
+        threading.Thread(target=self._promote, args=(app, upload_id, delay), name='storage-promote', daemon=True).start()
+
+    def _promote(self, app, upload_id, delay=0):
+        from app import db
+        from app.models import FileUpload
+        try:
+            if delay:
+                time.sleep(delay)
+            with app.app_context():
+                upload = db.session.get(FileUpload, upload_id)
+                if not upload or upload.storage_tier != COLD:
+                    return
+                cold_path = upload.upload_path
+                hot_path = os.path.join(app.config['UPLOAD_FOLDER'], upload.filename)
+                copy_file(cold_path, hot_path, decompress=cold_path.endswith(COMPRESSED_SUFFIX))
+                if switch_path(upload_id, cold_path, hot_path, HOT):
+                    remove_quietly(cold_path)
+                else:
+                    remove_quietly(hot_path)
+        except Exception as e:
+            app.logger.error(f"Promotion error for {upload_id}: {e}")
+        finally:
+            with self._lock:
+                self._promoting.discard(upload_id)
+
+    def send(self, upload):
+        """Send a cold upload's file, decompressing on the fly, and start its promotion.
+
+        The file is opened before promotion starts, so removing the cold copy
+        afterwards does not interrupt this download.
+        """
+        if upload.upload_path.endswith(COMPRESSED_SUFFIX):
+            response = send_file(
+                gzip.open(upload.upload_path, 'rb'),
+                as_attachment=True,
+                download_name=upload.original_name,
+                mimetype=upload.mime_type
+            )
+            response.content_length = upload.size
+        else:
+            response = send_file(
+                upload.upload_path,
+                as_attachment=True,
+                download_name=upload.original_name,
+                mimetype=upload.mime_type
+            )
+        self.promote_async(upload.id)
+        return response
+
+    def stats(self):
+        from app import db
+        from app.models import FileUpload
+
+        tiers = {HOT: {'files': 0, 'bytes': 0}, COLD: {'files': 0, 'bytes': 0}}
+        rows = db.session.query(
+            FileUpload.storage_tier, db.func.count(FileUpload.id), db.func.sum(FileUpload.size)
+        ).filter(FileUpload.is_active.is_(True)).group_by(FileUpload.storage_tier).all()
+        for tier, files, size in rows:
+            tiers[tier] = {'files': files, 'bytes': size or 0}
+
+        return {
+            'enabled': self.enabled,
+            'cold_after_days': self.cold_after.days,
+            'compress': self.compress,
+            'tiers': tiers,
+            'running': self._running,
+            'promotions_in_progress': len(self._promoting),
+            'last_run': self.last_run
+        }
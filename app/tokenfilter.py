@@ -0,0 +1,280 @@
+"""Negative lookup filter for share tokens.
+
+A Bloom filter over the tokens of active share links lets the share routes
+turn away random or guessed tokens without a database query. A Bloom filter
+never gives false negatives, so valid links always reach the database;
+false positives only cost the query the route would have made anyway.
+Expired links stay in the filter until they are deactivated, so they still
+reach the routes' expiry check and answer 410.
+
+Entries cannot be removed from a Bloom filter. Deleted or deactivated
+tokens are counted as stale instead, and once too many accumulate (or the
+filter outgrows its capacity) it is rebuilt from the database in the
+background.
+
+Each worker process keeps its own filter. A background thread adds links
+created by other workers every SHARE_FILTER_SYNC_SECONDS, so a link made
+on another worker is turned away for at most about that long after it is
+created. A miss is rejected as long as the last sync started less than
+SHARE_FILTER_MAX_STALE_SECONDS ago; if syncing falls behind (e.g. the
+database is unreachable) misses go on to the database until it catches up.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import g
+
+# Re-read links created this long before the last sync, to catch rows
+# whose transaction committed after the sync query ran
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter sized from a capacity and target false-positive rate"""
+
+    def __init__(self, capacity, fp_rate, max_bytes=None):
+        capacity = max(int(capacity), 1)
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        if max_bytes:
+            num_bits = min(num_bits, max_bytes * 8)
+        self.num_bits = max(num_bits, 64)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def estimated_fp_rate(self):
+        """False-positive rate expected at the current fill level"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class ShareTokenFilter:
+    """Flask extension holding the per-process share token filter"""
+
+    def __init__(self, app=None):
+        self._filter = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._added_during_build = []
+        self._last_sync = None
+        self._synced_at = None
+        self._stale = 0
+        self._syncer = None
+        self._generation = 0
+        self.metrics = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SHARE_FILTER_ENABLED', True)
+        self.fp_rate = app.config.get('SHARE_FILTER_FP_RATE', 0.001)
+        self.max_bytes = app.config.get('SHARE_FILTER_MAX_BYTES', 16 * 1024 * 1024)
+        self.min_capacity = app.config.get('SHARE_FILTER_MIN_CAPACITY', 100000)
+        self.sync_seconds = app.config.get('SHARE_FILTER_SYNC_SECONDS', 1.0)
+        self.max_stale_seconds = app.config.get('SHARE_FILTER_MAX_STALE_SECONDS', 10.0)
+        self.stale_ratio = app.config.get('SHARE_FILTER_STALE_RATIO', 0.25)
+        # A filter describes one database; start over for a new app
+        with self._lock:
+            self._filter = None
+            self._last_sync = None
+            self._synced_at = None
+            self._stale = 0
+            # Tells a sync thread of the previous app to stop
+            self._generation += 1
+            self.metrics = {
+                'checks': 0,
+                'rejected': 0,
+                'passed': 0,
+                'false_positives': 0,
+                'unavailable': 0,
+                'unsynced': 0,
+                'syncs': 0,
+                'rebuilds': 0
+            }
+        app.extensions['share_token_filter'] = self
+
+    def might_exist(self, token):
+        """Return False only if token is certainly not an active share token"""
+        if not self.enabled:
+            return True
+        self.metrics['checks'] += 1
+
+        bloom = self._filter
+        if bloom is None:
+            # Fail open until the background build has finished
+            self.metrics['unavailable'] += 1
+            self._start_build()
+            return True
+
+        if token in bloom:
+            self.metrics['passed'] += 1
+            g.share_filter_maybe = True
+            return True
+
+        if time.monotonic() - self._synced_at > self.max_stale_seconds:
+            # Syncing has fallen behind, so the filter may lack other workers' links
+            self.metrics['unsynced'] += 1
+            self._ensure_syncer()
+            return True
+
+        self.metrics['rejected'] += 1
+        return False
+
+    def record_false_positive(self):
+        """Count a token the filter let through that the database didn't know"""
+        if g.pop('share_filter_maybe', False):
+            self.metrics['false_positives'] += 1
+
+    def add(self, token):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._building:
+                # The build may have read its snapshot before this token was committed
+                self._added_during_build.append(token)
+            if self._filter is not None:
+                self._filter.add(token)
+                if self._filter.count > self._filter.capacity:
+                    self._start_build()
+
+    def mark_stale(self, count=1):
+        """Note tokens that were deleted or deactivated; rebuild once too many pile up"""
+        if not self.enabled or not count:
+            return
+        with self._lock:
+            self._stale += count
+            bloom = self._filter
+            if bloom is not None and self._stale > bloom.count * self.stale_ratio:
+                self._start_build()
+
+    def stats(self):
+        bloom = self._filter
+        data = dict(self.metrics, enabled=self.enabled, ready=bloom is not None, building=self._building,
+                    stale=self._stale)
+        if bloom is not None:
+            data.update({
+                'items': bloom.count,
+                'capacity': bloom.capacity,
+                'memory_bytes': len(bloom.bits),
+                'num_hashes': bloom.num_hashes,
+                'target_fp_rate': self.fp_rate,
+                'estimated_fp_rate': round(bloom.estimated_fp_rate(), 6)
+            })
+        return data
+
+    def _start_build(self):
+        from flask import current_app
+        if self._building:
+            return
+        self._building = True
+        self._added_during_build = []
+        app = current_app._get_current_object()
+        threading.Thread(target=self._build, args=(app,), name='share-filter-build', daemon=True).start()
+
+    def _active_tokens_query(self):
+        from app import db
+        from app.models import FileUpload, ShareLink
+        # Expired links are kept: the share routes answer them with 410, not 404
+        return db.session.query(ShareLink.token).join(ShareLink.upload).filter(
+            ShareLink.is_active.is_(True),
+            FileUpload.is_active.is_(True)
+        )
+
+    def _build(self, app):
+        from app import db
+        from app.models import ShareLink
+        try:
+            with app.app_context():
+                started = time.monotonic()
+                started_at = datetime.utcnow()
+                query = self._active_tokens_query()
+                count = query.count()
+                bloom = BloomFilter(max(count * 2, self.min_capacity), self.fp_rate, self.max_bytes)
+                for (token,) in query.order_by(ShareLink.id).yield_per(10000):
+                    bloom.add(token)
+                db.session.remove()
+
+                with self._lock:
+                    for token in self._added_during_build:
+                        bloom.add(token)
+                    self._added_during_build = []
+                    self._filter = bloom
+                    self._stale = 0
+                    self._last_sync = started_at
+                    self._synced_at = started
+                    self.metrics['rebuilds'] += 1
+                self._ensure_syncer()
+                app.logger.info(
+                    f"Share token filter built: {bloom.count} tokens, {len(bloom.bits)} bytes, "
+                    f"estimated false-positive rate {bloom.estimated_fp_rate():.6f}"
+                )
+        except Exception as e:
+            app.logger.error(f"Share token filter build failed: {e}")
+        finally:
+            self._building = False
+
+    def _ensure_syncer(self):
+        """Start the background sync thread for the current app unless it is running"""
+        from flask import current_app
+        with self._lock:
+            if self._syncer is not None and self._syncer.is_alive() and self._syncer.generation == self._generation:
+                return
+            app = current_app._get_current_object()
+            self._syncer = threading.Thread(target=self._sync_loop, args=(app, self._generation),
+                                            name='share-filter-sync', daemon=True)
+            self._syncer.generation = self._generation
+            self._syncer.start()
+
+    def _sync_loop(self, app, generation):
+        from app import db
+        while self._generation == generation:
+            time.sleep(self.sync_seconds)
+            if self._generation != generation or self._filter is None:
+                continue
+            try:
+                with app.app_context():
+                    self._sync_recent()
+                    db.session.remove()
+            except Exception as e:
+                app.logger.error(f"Share token filter sync failed: {e}")
+
+    def _sync_recent(self):
+        """Add tokens created since the last sync; runs in the sync thread"""
+        from app.models import ShareLink
+
+        with self._lock:
+            if self._last_sync is None:
+                return
+            since = self._last_sync - SYNC_OVERLAP
+
+        started = time.monotonic()
+        started_at = datetime.utcnow()
+        tokens = self._active_tokens_query().filter(ShareLink.created_at >= since).all()
+        with self._lock:
+            bloom = self._filter
+            if bloom is None:
+                return
+            for (token,) in tokens:
+                if token not in bloom:
+                    bloom.add(token)
+            self._last_sync = started_at
+            self._synced_at = started
+            self.metrics['syncs'] += 1
@@ -0,0 +1,220 @@
+"""Per-request tracing and slow-request profiling.
+
+Every request gets a request id (taken from an incoming X-Request-ID header
+or generated) which is echoed back in the response. Code marks interesting
+phases with the span() context manager; when the request finishes its spans
+are handed to the exporter, which by default writes one JSON log line per
+request to the 'fileshare.trace' logger.
+
+With PROFILE_SLOW_REQUESTS_MS set, a sampling profiler thread records the
+stack of every in-flight request every PROFILE_INTERVAL_MS. Requests slower
+than the threshold have their samples written to PROFILE_DIR in collapsed
+stack format (one "frame;frame;frame count" line per stack), ready for
+flamegraph tools; faster requests are simply discarded.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Incoming ids end up in logs and profile file names
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestTrace:
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []
+        self.stack = []
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a span of the current request; a no-op outside requests"""
+    trace = g.get('trace') if has_request_context() else None
+    if trace is None:
+        yield
+        return
+
+    record = {
+        'name': name,
+        'parent': trace.stack[-1] if trace.stack else None,
+        'start_ms': round((time.perf_counter() - trace.started) * 1000, 3)
+    }
+    if attrs:
+        record['attrs'] = attrs
+    trace.stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        trace.stack.pop()
+        trace.spans.append(record)
+
+
+def current_request_id():
+    trace = g.get('trace') if has_request_context() else None
+    return trace.request_id if trace else None
+
+
+class LogExporter:
+    """Writes each finished trace as one JSON line"""
+
+    def __init__(self, logger_name='fileshare.trace'):
+        self.logger = logging.getLogger(logger_name)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+
+    def export(self, trace_data):
+        self.logger.info(json.dumps(trace_data, separators=(',', ':')))
+
+
+class NullExporter:
+    def export(self, trace_data):
+        pass
+
+
+EXPORTERS = {
+    'log': LogExporter,
+    'none': NullExporter
+}
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered threads from a single background thread"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+
+    def unregister(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, None)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own_id:
+                        samples[collapse_stack(frame)] += 1
+
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Tracer:
+    """Flask extension wiring request ids, spans, export and profiling into requests"""
+
+    def __init__(self, app=None):
+        self.profiler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('TRACING_ENABLED', True)
+        exporter = app.config.get('TRACE_EXPORTER', 'log')
+        if exporter not in EXPORTERS:
+            raise ValueError(f'Unknown TRACE_EXPORTER: {exporter}')
+        self.exporter = EXPORTERS[exporter]()
+
+        self.slow_ms = app.config.get('PROFILE_SLOW_REQUESTS_MS')
+        self.profile_dir = app.config.get('PROFILE_DIR')
+        if self.slow_ms:
+            self.profiler = SamplingProfiler(app.config.get('PROFILE_INTERVAL_MS', 5) / 1000)
+            os.makedirs(self.profile_dir, exist_ok=True)
+
+        app.extensions['tracer'] = self
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        g.trace = RequestTrace(request_id)
+        if self.profiler:
+            self.profiler.register(threading.get_ident())
+
+    def _after_request(self, response):
+        trace = g.get('trace')
+        if trace is not None:
+            response.headers[REQUEST_ID_HEADER] = trace.request_id
+            g.trace_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return
+        duration_ms = (time.perf_counter() - trace.started) * 1000
+        samples = self.profiler.unregister(threading.get_ident()) if self.profiler else None
+
+        trace_data = {
+            'request_id': trace.request_id,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': g.pop('trace_status', 500),
+            'duration_ms': round(duration_ms, 3),
+            'spans': trace.spans
+        }
+        if exc is not None:
+            trace_data['error'] = type(exc).__name__
+
+        if samples and duration_ms >= self.slow_ms:
+            trace_data['profile'] = self._write_profile(trace.request_id, samples)
+
+        try:
+            self.exporter.export(trace_data)
+        except Exception:
+            pass
+
+    def _write_profile(self, request_id, samples):
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id}.folded")
+        try:
+            with open(path, 'w') as profile:
+                for stack, count in samples.most_common():
+                    profile.write(f'{stack} {count}\n')
+        except OSError:
+            return None
+        return path
@@ -1,21 +1,89 @@
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, send_file, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import ClientDisconnected
 from werkzeug.utils import secure_filename
-from app import db, mail
-from app.models import User, FileUpload
+from app import db, mail, events, token_filter, upload_admission, metadata_extractor
+from app.events import UPLOAD_CREATED, UPLOAD_DELETED, SHARE_LINK_CREATED, SHARE_LINK_REVOKED, format_sse
+from app.models import User, FileUpload, ShareLink, UploadSession, UploadPart
+from app.fields import UPLOAD_FIELDS
+from app.metadata import ContentInspector, save_stream, inspect_head
+from app.search import search_uploads
+from app.tracing import span
+from app.storage import remove_quietly
 from flask_mail import Message
+import hashlib
 import os
+import re
+import shutil
+import tempfile
 import uuid
 from datetime import datetime, timedelta
 import secrets
 
 bp = Blueprint('upload', __name__)
 
+# Parts are sent with this header: the hex SHA-256 of the part's bytes
+PART_DIGEST_HEADER = 'X-Content-SHA256'
+SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+MAX_PARTS = 10000
+
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'zip', 'rar', 'mp4', 'avi', 'mov'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def build_share_message(recipient_email, sender_name, filename, share_token, expires_at=None):
+    """Build the share notification email for one link"""
+    # Use request host if available, otherwise fall back to config
+    from flask import request
+    if request and request.headers.get('Host'):
+        protocol = 'https' if request.is_secure else 'http'
+        base_url = f"{protocol}://{request.headers.get('Host')}/share/{share_token}"
+    else:
+        base_url = f"{current_app.config['CLIENT_URL']}/share/{share_token}"
+    
+    # Add email parameter if there's a specific recipient
+    if recipient_email:
+        from urllib.parse import quote
+        download_url = f"{base_url}?email={quote(recipient_email)}"
+    else:
+        download_url = base_url
+    current_app.logger.info(f"Download URL: {download_url}")
+    
+    expiration_text = ""
+    if expires_at:
+        expiration_text = f"This link will expire on {expires_at.strftime('%Y-%m-%d at %H:%M')}."
+    
+    return Message(
+        subject=f"{sender_name} shared a file with you: {filename}",
+        recipients=[recipient_email],
+        html=f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <h2>You've received a file share!</h2>
+            <p>Hello,</p>
+            <p><strong>{sender_name}</strong> has shared a file with you:</p>
+            
+            <div style="background-color: #f5f5f5; padding: 20px; border-radius: 5px; margin: 20px 0;">
+                <h3 style="margin: 0 0 10px 0;">📎 {filename}</h3>
+                <a href="{download_url}" 
+                   style="display: inline-block; background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">
+                    Download File
+                </a>
+            </div>
+            
+            <p><strong>Download Link:</strong> <a href="{download_url}">{download_url}</a></p>
+            
+            {f'<p><em>{expiration_text}</em></p>' if expiration_text else ''}
+            
+            <hr style="margin: 30px 0;">
+            <p style="color: #666; font-size: 12px;">
+                This is an automated message. Please do not reply to this email.
+                If you didn't expect this file, you can safely ignore this message.
+            </p>
+        </div>
+        """
+    )
+
 def send_share_notification(recipient_email, sender_name, filename, share_token, expires_at=None):
     """Send email notification for file share"""
     current_app.logger.info(f"=== EMAIL DEBUGGING START ===")
@@ -39,56 +107,7 @@ def send_share_notification(recipient_email, sender_name, filename, share_token,
     
     try:
         current_app.logger.info("Creating message...")
-        # Use request host if available, otherwise fall back to config
-        from flask import request
-        if request and request.headers.get('Host'):
-            protocol = 'https' if request.is_secure else 'http'
-            base_url = f"{protocol}://{request.headers.get('Host')}/share/{share_token}"
-        else:
-            base_url = f"{current_app.config['CLIENT_URL']}/share/{share_token}"
-        
-        # Add email parameter if there's a specific recipient
-        if recipient_email:
-            from urllib.parse import quote
-            download_url = f"{base_url}?email={quote(recipient_email)}"
-        else:
-            download_url = base_url
-        current_app.logger.info(f"Download URL: {download_url}")
-        
-        expiration_text = ""
-        if expires_at:
-            expiration_text = f"This link will expire on {expires_at.strftime('%Y-%m-%d at %H:%M')}."
-            current_app.logger.info(f"Expiration text: {expiration_text}")
-        
-        msg = Message(
-            subject=f"{sender_name} shared a file with you: {filename}",
-            recipients=[recipient_email],
-            html=f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2>You've received a file share!</h2>
-                <p>Hello,</p>
-                <p><strong>{sender_name}</strong> has shared a file with you:</p>
-                
-                <div style="background-color: #f5f5f5; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                    <h3 style="margin: 0 0 10px 0;">📎 {filename}</h3>
-                    <a href="{download_url}" 
-                       style="display: inline-block; background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">
-                        Download File
-                    </a>
-                </div>
-                
-                <p><strong>Download Link:</strong> <a href="{download_url}">{download_url}</a></p>
-                
-                {f'<p><em>{expiration_text}</em></p>' if expiration_text else ''}
-                
-                <hr style="margin: 30px 0;">
-                <p style="color: #666; font-size: 12px;">
-                    This is an automated message. Please do not reply to this email.
-                    If you didn't expect this file, you can safely ignore this message.
-                </p>
-            </div>
-            """
-        )
+        msg = build_share_message(recipient_email, sender_name, filename, share_token, expires_at)
         
         current_app.logger.info(f"Message created - Subject: {msg.subject}")
         current_app.logger.info(f"Message recipients: {msg.recipients}")
@@ -103,28 +122,30 @@ def send_share_notification(recipient_email, sender_name, filename, share_token,
             
             current_app.logger.info("Testing raw SMTP connection...")
             
-            if current_app.config.get('MAIL_USE_SSL'):
-                current_app.logger.info("Using SSL connection...")
-                context = ssl.create_default_context()
-                server = smtplib.SMTP_SSL(
-                    current_app.config['MAIL_SERVER'], 
-                    current_app.config['MAIL_PORT'], 
-                    context=context
-                )
-            else:
-                current_app.logger.info("Using TLS connection...")
-                server = smtplib.SMTP(
-                    current_app.config['MAIL_SERVER'], 
-                    current_app.config['MAIL_PORT']
-                )
-                if current_app.config.get('MAIL_USE_TLS'):
-                    server.starttls()
+            with span('smtp.connect', ssl=bool(current_app.config.get('MAIL_USE_SSL'))):
+                if current_app.config.get('MAIL_USE_SSL'):
+                    current_app.logger.info("Using SSL connection...")
+                    context = ssl.create_default_context()
+                    server = smtplib.SMTP_SSL(
+                        current_app.config['MAIL_SERVER'], 
+                        current_app.config['MAIL_PORT'], 
+                        context=context
+                    )
+                else:
+                    current_app.logger.info("Using TLS connection...")
+                    server = smtplib.SMTP(
+                        current_app.config['MAIL_SERVER'], 
+                        current_app.config['MAIL_PORT']
+                    )
+                    if current_app.config.get('MAIL_USE_TLS'):
+                        server.starttls()
             
             current_app.logger.info("SMTP connection established, attempting login...")
-            server.login(
-                current_app.config['MAIL_USERNAME'], 
-                current_app.config['MAIL_PASSWORD']
-            )
+            with span('smtp.login'):
+                server.login(
+                    current_app.config['MAIL_USERNAME'], 
+                    current_app.config['MAIL_PASSWORD']
+                )
             current_app.logger.info("SMTP login successful")
             server.quit()
             current_app.logger.info("Raw SMTP test completed successfully")
@@ -143,7 +164,8 @@ def send_share_notification(recipient_email, sender_name, filename, share_token,
         # Now try Flask-Mail
         current_app.logger.info("Sending via Flask-Mail...")
         try:
-            mail.send(msg)
+            with span('mail.send'):
+                mail.send(msg)
             current_app.logger.info(f"✅ Email sent successfully via Flask-Mail to {recipient_email}")
             current_app.logger.info(f"=== EMAIL DEBUGGING END (SUCCESS) ===")
             return True
@@ -160,7 +182,7 @@ def send_share_notification(recipient_email, sender_name, filename, share_token,
                 
                 context = ssl.create_default_context()
                 
-                with smtplib.SMTP_SSL(
+                with span('smtp.fallback_send'), smtplib.SMTP_SSL(
                     current_app.config['MAIL_SERVER'], 
                     current_app.config['MAIL_PORT'], 
                     context=context
@@ -199,14 +221,102 @@ def send_share_notification(recipient_email, sender_name, filename, share_token,
         current_app.logger.error(f"=== EMAIL DEBUGGING END (FAILED) ===")
         return False
 
+def send_share_notifications(links, sender_name, filename):
+    """Send the emails for several share links over one SMTP connection; returns how many were sent"""
+    if not current_app.config.get('MAIL_USERNAME') or not current_app.config.get('MAIL_PASSWORD'):
+        current_app.logger.warning("Email not configured - missing username or password")
+        return 0
+    
+    sent = 0
+    try:
+        with span('mail.send_batch', recipients=len(links)):
+            with mail.connect() as connection:
+                for link in links:
+                    try:
+                        connection.send(build_share_message(
+                            link.recipient_email, sender_name, filename, link.token, link.expires_at
+                        ))
+                        sent += 1
+                    except Exception as e:
+                        current_app.logger.error(f"Share notification to {link.recipient_email} failed: {e}")
+    except Exception as e:
+        current_app.logger.error(f"Batch share notification failed: {e}")
+    return sent
+
+def make_stored_filename(original_filename):
+    return f"{uuid.uuid4()}{os.path.splitext(original_filename)[1]}"
+
+def create_upload(user, original_filename, unique_filename, upload_path, inspection,
+                  recipient_email=None, expiration_hours=None, max_downloads=None):
+    """Record a stored file with its first share link, then announce it and notify the recipient.
+
+    inspection is the ContentInspector result for the file; whole-file
+    extractors are queued once the row is committed.
+    """
+    # Generate secure share token
+    share_token = secrets.token_urlsafe(32)
+    
+    # Calculate expiration date
+    expires_at = None
+    if expiration_hours and expiration_hours > 0:
+        expires_at = datetime.utcnow() + timedelta(hours=expiration_hours)
+    
+    # Create database record
+    file_upload = FileUpload(
+        original_name=original_filename,
+        filename=unique_filename,
+        size=os.path.getsize(upload_path),
+        upload_path=upload_path,
+        share_token=share_token,
+        recipient_email=recipient_email if recipient_email else None,
+        expires_at=expires_at,
+        max_downloads=max_downloads,
+        uploader_id=user.id
+    )
+    heavy = metadata_extractor.apply(file_upload, inspection)
+    
+    db.session.add(file_upload)
+    db.session.add(ShareLink(
+        upload=file_upload,
+        token=share_token,
+        recipient_email=file_upload.recipient_email,
+        expires_at=expires_at,
+        max_downloads=max_downloads
+    ))
+    with span('db.commit'):
+        db.session.commit()
+    
+    token_filter.add(share_token)
+    events.publish(user.id, UPLOAD_CREATED, file_upload.to_dict())
+    
+    if heavy:
+        try:
+            metadata_extractor.submit(file_upload)
+        except Exception as e:
+            current_app.logger.error(f"Metadata extraction submit error: {e}")
+    
+    # Send email notification if recipient email is provided
+    if recipient_email:
+        with span('upload.notify'):
+            send_share_notification(
+                recipient_email=recipient_email,
+                sender_name=user.name,
+                filename=original_filename,
+                share_token=share_token,
+                expires_at=expires_at
+            )
+    
+    return file_upload
+
 @bp.route('/', methods=['POST'])
 @jwt_required()
+@upload_admission.guard
 def upload_file():
     try:
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
         
-        if not user:
+        if not user or not user.is_active:
             return jsonify({'error': 'User not found'}), 404
         
         # Check if file is in request
@@ -226,56 +336,275 @@ def upload_file():
         if recipient_email:
             from email_validator import validate_email, EmailNotValidError
             try:
-                validate_email(recipient_email)
+                with span('upload.validate_email'):
+                    validate_email(recipient_email)
             except EmailNotValidError:
                 return jsonify({'error': 'Invalid recipient email format'}), 400
         
         # Generate unique filename
         original_filename = secure_filename(file.filename)
-        file_extension = os.path.splitext(original_filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        
-        # Generate secure share token
-        share_token = secrets.token_urlsafe(32)
-        
-        # Calculate expiration date
-        expires_at = None
-        if expiration_hours and expiration_hours > 0:
-            expires_at = datetime.utcnow() + timedelta(hours=expiration_hours)
+        unique_filename = make_stored_filename(original_filename)
         
         # Save file
         upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(upload_path)
+        # Sniff the type and hash the file in the same pass that writes it
+        inspector = ContentInspector()
+        with span('upload.save_file'):
+            save_stream(file.stream, upload_path, inspector)
+        
+        file_upload = create_upload(
+            user,
+            original_filename,
+            unique_filename,
+            upload_path,
+            inspector.result(file.content_type),
+            recipient_email,
+            expiration_hours,
+            max_downloads
+        )
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'upload': file_upload.to_dict()
+        }), 201
         
-        # Get file size
-        file_size = os.path.getsize(upload_path)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload error: {e}")
+        
+        # Clean up file if it was saved
+        if 'upload_path' in locals() and os.path.exists(upload_path):
+            try:
+                os.remove(upload_path)
+            except:
+                pass
         
-        # Create database record
-        file_upload = FileUpload(
+        return jsonify({'error': 'Upload failed'}), 500
+
+def get_partial_folder():
+    folder = current_app.config.get('UPLOAD_PARTIAL_FOLDER') or os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def discard_session(session):
+    """Remove a chunked upload's partial file and rows; the caller commits"""
+    if os.path.exists(session.path):
+        try:
+            os.remove(session.path)
+        except OSError as e:
+            current_app.logger.error(f"Partial file deletion error: {e}")
+    db.session.delete(session)
+
+def purge_expired_sessions():
+    """Drop chunked uploads abandoned for longer than UPLOAD_SESSION_TTL_HOURS"""
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config.get('UPLOAD_SESSION_TTL_HOURS', 24))
+    for session in UploadSession.query.filter(UploadSession.created_at < cutoff).limit(100).all():
+        discard_session(session)
+    db.session.commit()
+
+@bp.route('/sessions', methods=['POST'])
+@jwt_required()
+def create_upload_session():
+    """Start a chunked upload; the file is then sent as parts, possibly in parallel"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if not user or not user.is_active:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json() or {}
+        original_filename = secure_filename(data.get('filename') or '')
+        size = data.get('size')
+        recipient_email = (data.get('recipient_email') or '').strip()
+        expiration_hours = data.get('expiration_hours')
+        max_downloads = data.get('max_downloads')
+        
+        if not original_filename:
+            return jsonify({'error': 'No file selected'}), 400
+        if not isinstance(size, int) or size <= 0:
+            return jsonify({'error': 'size must be a positive integer'}), 400
+        if size > current_app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'error': 'File is too large'}), 413
+        for name, value in (('expiration_hours', expiration_hours), ('max_downloads', max_downloads)):
+            if value is not None and not isinstance(value, int):
+                return jsonify({'error': f'{name} must be an integer'}), 400
+        
+        # Validate recipient email if provided
+        if recipient_email:
+            from email_validator import validate_email, EmailNotValidError
+            try:
+                with span('upload.validate_email'):
+                    validate_email(recipient_email)
+            except EmailNotValidError:
+                return jsonify({'error': 'Invalid recipient email format'}), 400
+        
+        purge_expired_sessions()
+        
+        part_size = max(current_app.config.get('UPLOAD_PART_SIZE', 8 * 1024 * 1024), -(-size // MAX_PARTS))
+        session = UploadSession(
+            user_id=user_id,
             original_name=original_filename,
-            filename=unique_filename,
-            mime_type=file.content_type or 'application/octet-stream',
-            size=file_size,
-            upload_path=upload_path,
-            share_token=share_token,
-            recipient_email=recipient_email if recipient_email else None,
-            expires_at=expires_at,
-            max_downloads=max_downloads,
-            uploader_id=user_id
+            mime_type=data.get('mime_type') or 'application/octet-stream',
+            size=size,
+            part_size=part_size,
+            recipient_email=recipient_email or None,
+            expiration_hours=expiration_hours,
+            max_downloads=max_downloads
         )
+        session.id = str(uuid.uuid4())
+        session.path = os.path.join(get_partial_folder(), session.id)
         
-        db.session.add(file_upload)
+        # Parts are written in place at their offsets
+        with open(session.path, 'wb') as partial:
+            partial.truncate(size)
+        
+        db.session.add(session)
         db.session.commit()
         
-        # Send email notification if recipient email is provided
-        if recipient_email:
-            send_share_notification(
-                recipient_email=recipient_email,
-                sender_name=user.name,
-                filename=original_filename,
-                share_token=share_token,
-                expires_at=expires_at
-            )
+        return jsonify({'session': session.to_dict()}), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload session error: {e}")
+        if 'session' in locals() and os.path.exists(session.path):
+            os.remove(session.path)
+        return jsonify({'error': 'Failed to start upload'}), 500
+
+@bp.route('/sessions/<session_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(session_id):
+    """Report which parts of a chunked upload have arrived, for resuming"""
+    session = UploadSession.query.filter_by(id=session_id, user_id=get_jwt_identity()).first()
+    if not session:
+        return jsonify({'error': 'Upload session not found'}), 404
+    return jsonify({'session': session.to_dict()})
+
+@bp.route('/sessions/<session_id>/parts/<int:part_number>', methods=['PUT'])
+@jwt_required()
+@upload_admission.guard
+def upload_part(session_id, part_number):
+    """Store one part, hashing it while it streams to disk; a part whose digest differs is rejected.
+
+    The part is written to a temporary file first and copied into the
+    session's file only once its length and digest check out, so a bad
+    re-send can't overwrite a part that was already accepted.
+    """
+    try:
+        user_id = get_jwt_identity()
+        
+        session = UploadSession.query.filter_by(id=session_id, user_id=user_id).first()
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        if part_number >= session.part_count:
+            return jsonify({'error': 'Invalid part number'}), 400
+        
+        expected_length = session.part_length(part_number)
+        if request.content_length != expected_length:
+            return jsonify({'error': f'Part {part_number} must be {expected_length} bytes'}), 400
+        
+        claimed = request.headers.get(PART_DIGEST_HEADER, '').lower()
+        if not SHA256_HEX.match(claimed):
+            return jsonify({'error': f'{PART_DIGEST_HEADER} header with the part\'s hex SHA-256 is required'}), 400
+        
+        fd, part_path = tempfile.mkstemp(dir=os.path.dirname(session.path), prefix=f'{session.id}-{part_number}-',
+                                         suffix='.tmp')
+        try:
+            digest = hashlib.sha256()
+            received = 0
+            with os.fdopen(fd, 'w+b') as part_file:
+                with span('upload.receive_part', part=part_number, bytes=expected_length):
+                    try:
+                        while received < expected_length:
+                            chunk = request.stream.read(min(1024 * 1024, expected_length - received))
+                            if not chunk:
+                                break
+                            digest.update(chunk)
+                            part_file.write(chunk)
+                            received += len(chunk)
+                    except ClientDisconnected:
+                        pass
+                
+                if received != expected_length:
+                    return jsonify({'error': 'Incomplete part'}), 400
+                if digest.hexdigest() != claimed:
+                    return jsonify({'error': f'Checksum mismatch for part {part_number}; send it again'}), 400
+                
+                # Forget the part while its bytes are replaced, so an interrupted copy reads as missing
+                session.parts.filter_by(part_number=part_number).delete(synchronize_session=False)
+                db.session.commit()
+                
+                with span('upload.write_part', part=part_number, bytes=expected_length):
+                    part_file.seek(0)
+                    with open(session.path, 'r+b') as partial:
+                        partial.seek(part_number * session.part_size)
+                        shutil.copyfileobj(part_file, partial, 1024 * 1024)
+        finally:
+            remove_quietly(part_path)
+        
+        db.session.add(UploadPart(session_id=session.id, part_number=part_number, sha256=claimed))
+        db.session.commit()
+        
+        return jsonify({'part_number': part_number, 'sha256': claimed}), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload part error: {e}")
+        return jsonify({'error': 'Failed to store part'}), 500
+
+@bp.route('/sessions/<session_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload_session(session_id):
+    """Turn a chunked upload whose parts have all arrived into an upload.
+
+    Integrity rests on the parts: each was hashed as it was written and
+    refused unless it matched the client's digest, and a part sent again
+    overwrites its own byte range. So once exactly parts 0..part_count-1 are
+    recorded, the file holds the client's bytes. The whole-file SHA-256 is
+    then computed from the assembled file by the metadata pool.
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if not user or not user.is_active:
+            return jsonify({'error': 'User not found'}), 404
+        
+        session = UploadSession.query.filter_by(id=session_id, user_id=user_id).first()
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        received = [number for (number,) in session.parts.with_entities(UploadPart.part_number)
+                    .order_by(UploadPart.part_number)]
+        if received != list(range(session.part_count)):
+            expected = set(range(session.part_count))
+            missing = sorted(expected.difference(received))
+            if missing:
+                return jsonify({'error': 'Upload is missing parts', 'missing_parts': missing[:100]}), 400
+            # The part route refuses these, but they must never pass for a complete file
+            return jsonify({'error': 'Upload has unexpected parts'}), 400
+        
+        unique_filename = make_stored_filename(session.original_name)
+        upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+        with span('upload.save_file'):
+            os.replace(session.path, upload_path)
+        
+        # Parts arrive out of order, so only the head is inspected here; the pool computes the digest
+        with span('upload.inspect'):
+            inspection = inspect_head(upload_path).result(session.mime_type)
+        
+        # The session rows go in the same commit as the new upload
+        db.session.delete(session)
+        file_upload = create_upload(
+            user,
+            session.original_name,
+            unique_filename,
+            upload_path,
+            inspection,
+            session.recipient_email,
+            session.expiration_hours,
+            session.max_downloads
+        )
         
         return jsonify({
             'message': 'File uploaded successfully',
@@ -284,9 +613,9 @@ def upload_file():
         
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Upload error: {e}")
+        current_app.logger.error(f"Upload completion error: {e}")
         
-        # Clean up file if it was saved
+        # Clean up file if it was moved into place
         if 'upload_path' in locals() and os.path.exists(upload_path):
             try:
                 os.remove(upload_path)
@@ -295,24 +624,66 @@ def upload_file():
         
         return jsonify({'error': 'Upload failed'}), 500
 
+@bp.route('/sessions/<session_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload_session(session_id):
+    """Abandon a chunked upload"""
+    try:
+        session = UploadSession.query.filter_by(id=session_id, user_id=get_jwt_identity()).first()
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        discard_session(session)
+        db.session.commit()
+        
+        return jsonify({'message': 'Upload cancelled'})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to cancel upload'}), 500
+
 @bp.route('/my-uploads', methods=['GET'])
 @jwt_required()
 def get_my_uploads():
     try:
         user_id = get_jwt_identity()
+        fields = UPLOAD_FIELDS.parse(request.args)
         
-        uploads = FileUpload.query.filter_by(
-            uploader_id=user_id,
-            is_active=True
+        uploads = UPLOAD_FIELDS.query(fields).filter(
+            FileUpload.uploader_id == user_id,
+            FileUpload.is_active.is_(True)
         ).order_by(FileUpload.created_at.desc()).all()
         
         return jsonify({
-            'uploads': [upload.to_dict() for upload in uploads]
+            'uploads': [UPLOAD_FIELDS.serialize(upload, fields) for upload in uploads]
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to fetch uploads'}), 500
 
+@bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_my_uploads():
+    """Search the current user's active uploads"""
+    try:
+        user_id = get_jwt_identity()
+        
+        query = FileUpload.query.filter_by(uploader_id=user_id, is_active=True)
+        uploads, next_cursor = search_uploads(request.args, query)
+        
+        return jsonify({
+            'uploads': [upload.to_dict() for upload in uploads],
+            'next_cursor': next_cursor
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Upload search error: {e}")
+        return jsonify({'error': 'Failed to search uploads'}), 500
+
 @bp.route('/<upload_id>', methods=['DELETE'])
 @jwt_required()
 def delete_upload(upload_id):
@@ -338,8 +709,169 @@ def delete_upload(upload_id):
         upload.is_active = False
         db.session.commit()
         
+        token_filter.mark_stale()
+        events.publish(user_id, UPLOAD_DELETED, {'id': upload.id})
+        
         return jsonify({'message': 'Upload deleted successfully'})
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': 'Failed to delete upload'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to delete upload'}), 500
+
+@bp.route('/<upload_id>/links', methods=['GET'])
+@jwt_required()
+def get_share_links(upload_id):
+    """List the share links of one of the current user's uploads"""
+    try:
+        user_id = get_jwt_identity()
+        
+        upload = FileUpload.query.filter_by(id=upload_id, uploader_id=user_id, is_active=True).first()
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        links = upload.links.order_by(ShareLink.created_at.desc()).all()
+        
+        return jsonify({'links': [link.to_dict() for link in links]})
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch share links'}), 500
+
+@bp.route('/<upload_id>/links', methods=['POST'])
+@jwt_required()
+def create_share_links(upload_id):
+    """Share an existing upload again: one new link per recipient, without storing the file twice"""
+    try:
+        user_id = get_jwt_identity()
+        user = User.query.get(user_id)
+        
+        if not user or not user.is_active:
+            return jsonify({'error': 'User not found'}), 404
+        
+        upload = FileUpload.query.filter_by(id=upload_id, uploader_id=user_id, is_active=True).first()
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        data = request.get_json() or {}
+        recipients = data.get('recipients') or []
+        if not isinstance(recipients, list) or not all(isinstance(email, str) for email in recipients):
+            return jsonify({'error': 'recipients must be a list of email addresses'}), 400
+        
+        max_recipients = current_app.config.get('SHARE_LINK_MAX_RECIPIENTS', 50)
+        recipients = list(dict.fromkeys(email.lower().strip() for email in recipients if email.strip()))
+        if len(recipients) > max_recipients:
+            return jsonify({'error': f'At most {max_recipients} recipients per request'}), 400
+        
+        expiration_hours = data.get('expiration_hours')
+        max_downloads = data.get('max_downloads')
+        if expiration_hours is not None and not isinstance(expiration_hours, int):
+            return jsonify({'error': 'expiration_hours must be an integer'}), 400
+        if max_downloads is not None and not isinstance(max_downloads, int):
+            return jsonify({'error': 'max_downloads must be an integer'}), 400
+        
+        # Validate recipient emails
+        from email_validator import validate_email, EmailNotValidError
+        with span('upload.validate_email', count=len(recipients)):
+            for email in recipients:
+                try:
+                    validate_email(email)
+                except EmailNotValidError:
+                    return jsonify({'error': f'Invalid recipient email format: {email}'}), 400
+        
+        expires_at = None
+        if expiration_hours and expiration_hours > 0:
+            expires_at = datetime.utcnow() + timedelta(hours=expiration_hours)
+        
+        # Without recipients, mint a single link that anyone can use
+        links = [
+            ShareLink(
+                upload_id=upload.id,
+                token=secrets.token_urlsafe(32),
+                recipient_email=email,
+                expires_at=expires_at,
+                max_downloads=max_downloads
+            )
+            for email in (recipients or [None])
+        ]
+        db.session.add_all(links)
+        with span('db.commit'):
+            db.session.commit()
+        
+        for link in links:
+            token_filter.add(link.token)
+        events.publish(user_id, SHARE_LINK_CREATED, {'id': upload.id, 'links': [link.to_dict() for link in links]})
+        
+        notifications_sent = 0
+        if recipients and data.get('notify', True):
+            notifications_sent = send_share_notifications(
+                [link for link in links if link.recipient_email],
+                sender_name=user.name,
+                filename=upload.original_name
+            )
+        
+        return jsonify({
+            'message': f'{len(links)} share link(s) created',
+            'links': [link.to_dict() for link in links],
+            'notifications_sent': notifications_sent
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Share link error: {e}")
+        return jsonify({'error': 'Failed to create share links'}), 500
+
+@bp.route('/<upload_id>/links/<link_id>', methods=['DELETE'])
+@jwt_required()
+def revoke_share_link(upload_id, link_id):
+    """Disable one share link; the file and its other links stay available"""
+    try:
+        user_id = get_jwt_identity()
+        
+        link = ShareLink.query.join(ShareLink.upload).filter(
+            ShareLink.id == link_id,
+            ShareLink.upload_id == upload_id,
+            FileUpload.uploader_id == user_id
+        ).first()
+        
+        if not link:
+            return jsonify({'error': 'Share link not found'}), 404
+        
+        link.is_active = False
+        db.session.commit()
+        
+        token_filter.mark_stale()
+        events.publish(user_id, SHARE_LINK_REVOKED, {'id': upload_id, 'link_id': link.id})
+        
+        return jsonify({'message': 'Share link revoked successfully'})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to revoke share link'}), 500
+
+@bp.route('/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """Server-Sent Events feed of activity on the current user's uploads.
+
+    EventSource cannot set headers, so the token may also be passed as ?jwt=.
+    """
+    user_id = get_jwt_identity()
+    keepalive = current_app.config.get('EVENTS_KEEPALIVE_SECONDS', 15)
+    subscription = events.subscribe(user_id)
+    
+    def generate():
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield f"retry: {keepalive * 1000}\n\n"
+            while True:
+                message = subscription.get(timeout=keepalive)
+                if message is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield format_sse(message)
+        finally:
+            subscription.close()
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""Download offload check and benchmark behind a stub reverse proxy.
+
+Starts the app on a local port and, in front of it, a small proxy that
+behaves like nginx with an `internal` location (or like mod_xsendfile):
+requests are forwarded to the app, and a response carrying X-Accel-Redirect
+or X-Sendfile is replaced by the named file, sent with sendfile(2) and the
+app's Content-Type and Content-Disposition. Requests for the internal
+locations from outside get 404, as they would from nginx.
+
+It first checks that offloaded downloads still enforce recipient, expiry
+and download limits, carry the right headers and deliver the exact bytes
+(including a cold-tier file), then times downloads through the proxy with
+and without offloading:
+
+    python benchmarks/offload_proxy.py
+    python benchmarks/offload_proxy.py --mode x-sendfile --size-mb 200 --repeat 20
+"""
+import argparse
+import hashlib
+import http.client
+import logging
+import os
+import secrets
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.serving import make_server
+
+from config import Config
+from app import create_app, db
+from app.models import User, FileUpload, ShareLink
+from app.storage import COLD
+
+# Headers nginx keeps from the upstream response when following X-Accel-Redirect
+PASSED_HEADERS = ('Content-Type', 'Content-Disposition', 'Cache-Control', 'Expires', 'Set-Cookie', 'X-Request-ID')
+HOP_HEADERS = ('Connection', 'Keep-Alive', 'Transfer-Encoding', 'X-Accel-Redirect', 'X-Sendfile')
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_proxy_handler(upstream_port, locations, sendfile_roots, counters):
+    """locations maps internal URI prefixes to folders, like nginx `location ... { internal; alias ...; }`"""
+
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if any(self.path.startswith(prefix) for prefix in locations):
+                self.send_error(404)
+                return
+
+            upstream = http.client.HTTPConnection('127.0.0.1', upstream_port)
+            upstream.request('GET', self.path, headers={'Host': self.headers.get('Host', 'localhost')})
+            response = upstream.getresponse()
+            body = response.read()
+            headers = response.getheaders()
+            upstream.close()
+
+            accel = response.getheader('X-Accel-Redirect')
+            sendfile = response.getheader('X-Sendfile')
+            if accel:
+                counters['offloaded'] += 1
+                self.send_internal(self.resolve_location(accel), headers)
+            elif sendfile:
+                counters['offloaded'] += 1
+                path = os.path.realpath(sendfile)
+                allowed = any(os.path.commonpath([root, path]) == root for root in sendfile_roots)
+                self.send_internal(path if allowed else None, headers)
+            else:
+                counters['proxied'] += 1
+                self.send_response(response.status, response.reason)
+                for name, value in headers:
+                    if name not in HOP_HEADERS and name != 'Content-Length':
+                        self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        def resolve_location(self, uri):
+            for prefix, folder in locations.items():
+                if uri.startswith(prefix):
+                    path = os.path.realpath(os.path.join(folder, unquote(uri[len(prefix):])))
+                    if os.path.commonpath([folder, path]) == folder:
+                        return path
+            return None
+
+        def send_internal(self, path, upstream_headers):
+            if path is None or not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                self.send_response(200)
+                for name, value in upstream_headers:
+                    if name in PASSED_HEADERS:
+                        self.send_header(name, value)
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+                self.wfile.flush()
+                self.connection.sendfile(f)
+
+    return ProxyHandler
+
+
+def build_app(tmp, mode, size_mb):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+        COLD_STORAGE_FOLDER = os.path.join(tmp, 'cold')
+        FILE_OFFLOAD = mode
+        TRACE_EXPORTER = 'none'
+        SHARE_FILTER_ENABLED = False
+        OFFLOAD_PROMOTE_DELAY = 3600
+
+    app = create_app(BenchConfig)
+    files = {}
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.org', name='Bench')
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.commit()
+
+        def add(name, folder, data, tier='hot', **link):
+            stored = f'{uuid.uuid4()}.bin'
+            path = os.path.join(folder, stored)
+            with open(path, 'wb') as f:
+                f.write(data)
+            token = secrets.token_urlsafe(32)
+            upload = FileUpload(
+                original_name=name, filename=stored, mime_type='application/pdf', size=len(data),
+                upload_path=path, share_token=token, uploader_id=user.id, storage_tier=tier
+            )
+            db.session.add(upload)
+            db.session.add(ShareLink(upload=upload, token=token, **link))
+            files[name] = (token, hashlib.sha256(data).hexdigest(), len(data))
+
+        add('big report.pdf', app.config['UPLOAD_FOLDER'], os.urandom(size_mb * 1024 * 1024))
+        add('Übersicht.pdf', app.config['UPLOAD_FOLDER'], os.urandom(4096))
+        add('archived.pdf', app.config['COLD_STORAGE_FOLDER'], os.urandom(65536), tier=COLD)
+        add('private.pdf', app.config['UPLOAD_FOLDER'], b'private', recipient_email='r@example.org')
+        add('expired.pdf', app.config['UPLOAD_FOLDER'], b'expired', expires_at=datetime.utcnow() - timedelta(hours=1))
+        add('once.pdf', app.config['UPLOAD_FOLDER'], b'once', max_downloads=1)
+        db.session.commit()
+    return app, files
+
+
+def fetch(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = response.read(1024 * 1024)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    connection.close()
+    return response, digest.hexdigest(), size
+
+
+def serve(app, mode):
+    app_server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+
+    locations = {}
+    if mode == 'x-accel':
+        locations = {
+            app.config['X_ACCEL_UPLOADS_LOCATION']: os.path.realpath(app.config['UPLOAD_FOLDER']),
+            app.config['X_ACCEL_COLD_LOCATION']: os.path.realpath(app.config['COLD_STORAGE_FOLDER'])
+        }
+    roots = [os.path.realpath(app.config['UPLOAD_FOLDER']), os.path.realpath(app.config['COLD_STORAGE_FOLDER'])]
+    counters = {'offloaded': 0, 'proxied': 0}
+    proxy = ThreadingHTTPServer(('127.0.0.1', 0), make_proxy_handler(app_server.server_port, locations, roots, counters))
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    return app_server, proxy, counters
+
+
+def run_checks(app, files, mode):
+    app_server, proxy, counters = serve(app, mode)
+    app_port, proxy_port = app_server.server_port, proxy.server_port
+    failures = []
+
+    def check(label, condition):
+        print(f"  {'ok  ' if condition else 'FAIL'} {label}")
+        if not condition:
+            failures.append(label)
+
+    header = 'X-Accel-Redirect' if mode == 'x-accel' else 'X-Sendfile'
+    token, digest, size = files['big report.pdf']
+    response, _, body_size = fetch(app_port, f'/share/{token}')
+    check(f'app answers with {header} and no body', response.getheader(header) is not None and body_size == 0)
+    check('app sets Content-Type', response.getheader('Content-Type') == 'application/pdf')
+    check('app sets Content-Disposition', response.getheader('Content-Disposition') == 'attachment; filename="big report.pdf"')
+
+    response, got_digest, got_size = fetch(proxy_port, f'/share/{token}')
+    check('proxy delivers the exact file', response.status == 200 and got_digest == digest and got_size == size)
+    check('proxy keeps Content-Disposition', response.getheader('Content-Disposition') == 'attachment; filename="big report.pdf"')
+
+    token, digest, _ = files['Übersicht.pdf']
+    response, got_digest, _ = fetch(proxy_port, f'/share/{token}')
+    check('non-ASCII names use filename*', "filename*=UTF-8''%C3%9Cbersicht.pdf" in (response.getheader('Content-Disposition') or '')
+          and got_digest == digest)
+
+    token, digest, _ = files['archived.pdf']
+    response, got_digest, _ = fetch(proxy_port, f'/share/{token}')
+    check('cold-tier file is offloaded too', response.status == 200 and got_digest == digest)
+
+    token, _, _ = files['private.pdf']
+    response, _, _ = fetch(proxy_port, f'/share/{token}?email=someone@example.org')
+    check('recipient restriction still applies (403)', response.status == 403)
+    response, _, _ = fetch(proxy_port, f'/share/{token}?email=r@example.org')
+    check('recipient can download', response.status == 200)
+
+    token, _, _ = files['expired.pdf']
+    response, _, _ = fetch(proxy_port, f'/share/{token}')
+    check('expired link is refused (410)', response.status == 410)
+
+    token, _, _ = files['once.pdf']
+    first, _, _ = fetch(proxy_port, f'/share/{token}')
+    second, _, _ = fetch(proxy_port, f'/share/{token}')
+    check('download limit still applies (200 then 410)', first.status == 200 and second.status == 410)
+
+    if mode == 'x-accel':
+        response, _, _ = fetch(proxy_port, app.config['X_ACCEL_UPLOADS_LOCATION'] + os.path.basename(app.config['UPLOAD_FOLDER']))
+        check('internal location is not reachable from outside (404)', response.status == 404)
+
+    with app.app_context():
+        counts = {upload.original_name: upload.download_count for upload in FileUpload.query.all()}
+    # The big file was fetched once from the app directly and once through the proxy
+    check('offloaded downloads are counted', counts['big report.pdf'] == 2 and counts['archived.pdf'] == 1)
+    check('proxy sent files itself', counters['offloaded'] == 5 and counters['proxied'] == 3)
+
+    app_server.shutdown()
+    proxy.shutdown()
+    return failures
+
+
+def time_downloads(app, files, repeat):
+    app_server, proxy, counters = serve(app, app.config['FILE_OFFLOAD'])
+    token, _, size = files['big report.pdf']
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fetch(proxy.server_port, f'/share/{token}')
+    elapsed = time.perf_counter() - started
+    app_server.shutdown()
+    proxy.shutdown()
+    return size * repeat / elapsed / 1024 / 1024, elapsed / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['x-accel', 'x-sendfile'], default='x-accel')
+    parser.add_argument('--size-mb', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        print(f'Checks ({args.mode}):')
+        os.makedirs(os.path.join(tmp, 'checks'))
+        app, files = build_app(os.path.join(tmp, 'checks'), args.mode, 1)
+        failures = run_checks(app, files, args.mode)
+
+        print(f'\nDownloading a {args.size_mb}MB file {args.repeat} times through the proxy:')
+        print(f"{'mode':<12} {'MB/s':>10} {'ms/download':>12}")
+        for mode in ('none', args.mode):
+            folder = os.path.join(tmp, mode)
+            os.makedirs(folder)
+            app, files = build_app(folder, mode, args.size_mb)
+            throughput, latency = time_downloads(app, files, args.repeat)
+            print(f'{mode:<12} {throughput:>10.1f} {latency:>12.1f}')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if failures:
+        print(f'\n{len(failures)} check(s) failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
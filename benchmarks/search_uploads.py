@@ -0,0 +1,152 @@
+"""Latency benchmark for the upload search endpoint queries.
+
+Fills a database with synthetic uploads and times one page of results for a
+set of typical searches, first page and a deep keyset page:
+
+    python benchmarks/search_uploads.py --rows 2000000
+    python benchmarks/search_uploads.py --database postgresql://... --rows 2000000
+
+Without --database a temporary SQLite file is used.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.datastructures import MultiDict
+
+from config import Config
+from app import create_app, db
+from app.models import User, FileUpload
+from app.search import search_uploads
+
+WORDS = ['report', 'invoice', 'contract', 'photo', 'backup', 'draft', 'final', 'scan', 'notes', 'budget',
+         'presentation', 'summary', 'holiday', 'meeting', 'design', 'archive', 'video', 'export', 'plan', 'review']
+TYPES = [('pdf', 'application/pdf'), ('png', 'image/png'), ('jpg', 'image/jpeg'), ('txt', 'text/plain'),
+         ('zip', 'application/zip'), ('mp4', 'video/mp4'), ('docx', 'application/vnd.openxmlformats')]
+DOMAINS = ['example.org', 'corp.io', 'mail.net', 'uni.edu']
+
+SCENARIOS = [
+    ('newest', {}),
+    ('fulltext one term', {'q': 'invoice'}),
+    ('fulltext two terms', {'q': 'final budget'}),
+    ('fulltext recipient', {'q': 'user42'}),
+    ('mime prefix', {'mime_type': 'image/'}),
+    ('size range by size', {'min_size': '1000000', 'max_size': '2000000', 'sort': 'size', 'order': 'asc'}),
+    ('recipient exact', {'recipient': 'user7@corp.io'}),
+    ('name sort', {'sort': 'name', 'order': 'asc'}),
+    ('combined', {'q': 'report', 'mime_type': 'application/pdf', 'min_size': '50000'}),
+]
+
+
+def populate(rows, batch_size=20000):
+    owner = User(email='bench@example.org', name='Bench')
+    owner.password_hash = 'x'
+    db.session.add(owner)
+    db.session.commit()
+
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=730)
+    table = FileUpload.__table__
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, rows)):
+            ext, mime = rng.choice(TYPES)
+            name = '_'.join(rng.sample(WORDS, rng.randint(1, 3))) + f'_{i}.{ext}'
+            created = start + timedelta(seconds=rng.randint(0, 730 * 86400))
+            batch.append({
+                'id': str(uuid.uuid4()),
+                'original_name': name,
+                'filename': f'{uuid.uuid4()}.{ext}',
+                'mime_type': mime,
+                'size': int(rng.lognormvariate(12, 2)),
+                'upload_path': f'/uploads/{i}',
+                'share_token': uuid.uuid4().hex + uuid.uuid4().hex,
+                'recipient_email': f'user{rng.randint(0, 5000)}@{rng.choice(DOMAINS)}' if rng.random() < 0.6 else None,
+                'download_count': 0,
+                'is_active': rng.random() < 0.9,
+                'created_at': created,
+                'updated_at': created,
+                'uploader_id': owner.id
+            })
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        print(f'\rinserted {min(offset + batch_size, rows):,} rows', end='', flush=True)
+    print()
+
+
+def measure(app, params, repeat, deep_pages):
+    first, deep = [], []
+    for _ in range(repeat):
+        args = MultiDict(params)
+        with app.test_request_context():
+            started = time.perf_counter()
+            _, cursor = search_uploads(args)
+            first.append(time.perf_counter() - started)
+
+            # Walk a few pages forward; the last one shows keyset cost at depth
+            for _ in range(deep_pages):
+                if not cursor:
+                    break
+                args = MultiDict(dict(params, cursor=cursor))
+                started = time.perf_counter()
+                _, cursor = search_uploads(args)
+            deep.append(time.perf_counter() - started)
+            db.session.remove()
+    return first, deep
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--database', help='SQLAlchemy URL (defaults to a temporary SQLite file)')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--deep-pages', type=int, default=50)
+    parser.add_argument('--target-ms', type=float, default=50.0, help='p95 latency target per page')
+    parser.add_argument('--reuse', action='store_true', help='Skip populating an already filled database')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database or f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        if not args.reuse:
+            started = time.perf_counter()
+            populate(args.rows)
+            print(f'populated in {time.perf_counter() - started:.1f}s')
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+
+    print(f"{'scenario':<22} {'p50 ms':>8} {'p95 ms':>8} {'deep p95':>9}  result")
+    failures = 0
+    for name, params in SCENARIOS:
+        first, deep = measure(app, params, args.repeat, args.deep_pages)
+        p95 = percentile(first, 95) * 1000
+        deep_p95 = percentile(deep, 95) * 1000
+        ok = p95 <= args.target_ms and deep_p95 <= args.target_ms
+        failures += not ok
+        print(f'{name:<22} {statistics.median(first) * 1000:>8.2f} {p95:>8.2f} {deep_p95:>9.2f}  {"ok" if ok else "SLOW"}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
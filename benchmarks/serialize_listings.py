@@ -0,0 +1,108 @@
+"""Encode time and payload size of the upload listing.
+
+Compares Flask's default JSON provider with orjson, for the full upload
+representation and a sparse ?fields= selection, at several listing sizes:
+
+    python benchmarks/serialize_listings.py
+    python benchmarks/serialize_listings.py --sizes 100 1000 10000 --fields id,original_name,size
+
+"request ms" is the whole GET /api/upload/my-uploads round trip through the
+test client (query, dict building and encoding); "encode ms" is the JSON
+encoding of the already built response body alone.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask_jwt_extended import create_access_token
+
+from config import Config
+from app import create_app, db
+from app.models import User, FileUpload
+
+
+def build_app(provider, tmp, rows):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, f"bench-{rows}.db")}'
+        UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+        JSON_PROVIDER = provider
+        SHARE_FILTER_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User.query.first()
+        if not user:
+            user = User(email='bench@example.org', name='Bench')
+            user.password_hash = 'x'
+            db.session.add(user)
+            db.session.commit()
+            now = datetime.utcnow()
+            db.session.execute(FileUpload.__table__.insert(), [{
+                'id': str(uuid.uuid4()),
+                'original_name': f'quarterly_report_{i}.pdf',
+                'filename': f'{uuid.uuid4()}.pdf',
+                'mime_type': 'application/pdf',
+                'size': 1000 + i,
+                'upload_path': f'/uploads/{i}.pdf',
+                'share_token': uuid.uuid4().hex + uuid.uuid4().hex,
+                'recipient_email': f'user{i}@example.org',
+                'expires_at': now + timedelta(days=7),
+                'download_count': i % 5,
+                'is_active': True,
+                'created_at': now - timedelta(seconds=i),
+                'updated_at': now,
+                'uploader_id': user.id
+            } for i in range(rows)])
+            db.session.commit()
+        token = create_access_token(identity=user.id)
+    return app, token
+
+
+def measure(app, token, fields, repeat):
+    client = app.test_client()
+    url = '/api/upload/my-uploads' + (f'?fields={fields}' if fields else '')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    request_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        request_times.append(time.perf_counter() - started)
+    body = response.get_json()
+
+    encode_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        app.json.dumps(body)
+        encode_times.append(time.perf_counter() - started)
+
+    return statistics.median(request_times), statistics.median(encode_times), len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--fields', default='id,original_name,size,download_count')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'rows':>6} {'provider':<8} {'fields':<7} {'request ms':>11} {'encode ms':>10} {'bytes':>10}")
+    for rows in args.sizes:
+        for provider in ('default', 'orjson'):
+            app, token = build_app(provider, tmp, rows)
+            for label, fields in (('full', None), ('sparse', args.fields)):
+                request_time, encode_time, size = measure(app, token, fields, args.repeat)
+                print(f'{rows:>6} {provider:<8} {label:<7} {request_time * 1000:>11.2f} {encode_time * 1000:>10.3f} {size:>10,}')
+
+
+if __name__ == '__main__':
+    main()
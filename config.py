@@ -18,6 +18,53 @@ class Config:
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     
+    # Chunked uploads: part size, staging folder (default UPLOAD_FOLDER/.partial, keep it on the
+    # same filesystem) and how long an unfinished upload is kept
+    UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE') or 8 * 1024 * 1024)
+    UPLOAD_PARTIAL_FOLDER = os.environ.get('UPLOAD_PARTIAL_FOLDER')
+    UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS') or 24)
+    
+    # Processes running whole-file metadata extractors (PDF pages, ZIP entries, chunked upload digests); 0 = off
+    METADATA_WORKERS = int(os.environ.get('METADATA_WORKERS') or 2)
+    
+    # Share previews (needs Pillow; PDFs also need pdftoppm): longest side in pixels, processes making them,
+    # on-disk cache (default UPLOAD_FOLDER/.previews) and its size budget per worker
+    PREVIEW_ENABLED = os.environ.get('PREVIEW_ENABLED', 'true').lower() in ['true', 'on', '1']
+    PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE') or 320)
+    PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS') or 2)
+    PREVIEW_CACHE_FOLDER = os.environ.get('PREVIEW_CACHE_FOLDER')
+    PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES') or 256 * 1024 * 1024)
+    PREVIEW_MAX_SOURCE_BYTES = int(os.environ.get('PREVIEW_MAX_SOURCE_BYTES') or 50 * 1024 * 1024)
+    PREVIEW_QUALITY = int(os.environ.get('PREVIEW_QUALITY') or 80)
+    # A request waits this long for its preview before getting 503; pdftoppm is killed after PREVIEW_RENDER_TIMEOUT
+    PREVIEW_WAIT_SECONDS = float(os.environ.get('PREVIEW_WAIT_SECONDS') or 10)
+    PREVIEW_RENDER_TIMEOUT = int(os.environ.get('PREVIEW_RENDER_TIMEOUT') or 30)
+    # Files that could not be rendered are not retried for this long; timeouts are always retried
+    PREVIEW_FAILURE_TTL = int(os.environ.get('PREVIEW_FAILURE_TTL') or 3600)
+    # Browsers and proxies may reuse a preview this long (never past the link's expiry)
+    PREVIEW_MAX_AGE = int(os.environ.get('PREVIEW_MAX_AGE') or 3600)
+    
+    # Upload admission control (per worker): concurrent uploads are capped globally and per user,
+    # wait up to UPLOAD_QUEUE_TIMEOUT seconds for a slot, then get 503 with Retry-After
+    UPLOAD_ADMISSION_ENABLED = os.environ.get('UPLOAD_ADMISSION_ENABLED', 'true').lower() in ['true', 'on', '1']
+    UPLOAD_MAX_CONCURRENT = int(os.environ.get('UPLOAD_MAX_CONCURRENT') or 8)
+    UPLOAD_MIN_CONCURRENT = int(os.environ.get('UPLOAD_MIN_CONCURRENT') or 2)
+    UPLOAD_MAX_PER_USER = int(os.environ.get('UPLOAD_MAX_PER_USER') or 2)
+    # Parts of one chunked upload that may share its slot; the web page sends four at a time
+    UPLOAD_MAX_PARTS_PER_SESSION = int(os.environ.get('UPLOAD_MAX_PARTS_PER_SESSION') or 4)
+    UPLOAD_QUEUE_TIMEOUT = float(os.environ.get('UPLOAD_QUEUE_TIMEOUT') or 5)
+    UPLOAD_QUEUE_MAX = int(os.environ.get('UPLOAD_QUEUE_MAX') or 32)
+    # Longest Retry-After (seconds) sent with a 503
+    UPLOAD_RETRY_AFTER_MAX = int(os.environ.get('UPLOAD_RETRY_AFTER_MAX') or 60)
+    UPLOAD_ADAPTIVE = os.environ.get('UPLOAD_ADAPTIVE', 'true').lower() in ['true', 'on', '1']
+    
+    # Cold storage tier; tiering is off unless COLD_STORAGE_FOLDER is set
+    COLD_STORAGE_FOLDER = os.environ.get('COLD_STORAGE_FOLDER')
+    COLD_STORAGE_COMPRESS = os.environ.get('COLD_STORAGE_COMPRESS', 'false').lower() in ['true', 'on', '1']
+    STORAGE_COLD_AFTER_DAYS = int(os.environ.get('STORAGE_COLD_AFTER_DAYS') or 30)
+    STORAGE_COLD_MIN_SIZE = int(os.environ.get('STORAGE_COLD_MIN_SIZE') or 64 * 1024)
+    STORAGE_TIER_BATCH_SIZE = int(os.environ.get('STORAGE_TIER_BATCH_SIZE') or 200)
+    
     # Email Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
@@ -30,5 +77,47 @@ class Config:
     # Application URLs
     CLIENT_URL = os.environ.get('CLIENT_URL') or 'http://localhost:3000'
     
+    # Download offload to the front proxy: 'none', 'x-accel' (nginx) or 'x-sendfile'
+    FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD') or 'none'
+    X_ACCEL_UPLOADS_LOCATION = os.environ.get('X_ACCEL_UPLOADS_LOCATION') or '/_protected/uploads/'
+    X_ACCEL_COLD_LOCATION = os.environ.get('X_ACCEL_COLD_LOCATION') or '/_protected/cold/'
+    # Offloaded cold files are promoted back to the hot tier this many seconds later
+    OFFLOAD_PROMOTE_DELAY = int(os.environ.get('OFFLOAD_PROMOTE_DELAY') or 30)
+    
+    # JSON encoder: 'auto' uses orjson when installed, or force 'orjson' / 'default'
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER') or 'auto'
+    
+    # Activity event stream (SSE)
+    # Set EVENTS_REDIS_URL to fan events out across multiple workers
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL')
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE') or 100)
+    EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('EVENTS_KEEPALIVE_SECONDS') or 15)
+    
+    # Bulk admin operations
+    ADMIN_BULK_MAX_IDS = int(os.environ.get('ADMIN_BULK_MAX_IDS') or 500)
+    CLEANUP_WORKERS = int(os.environ.get('CLEANUP_WORKERS') or 4)
+    CLEANUP_BATCH_SIZE = int(os.environ.get('CLEANUP_BATCH_SIZE') or 500)
+    
+    # Most recipients accepted by one share link request
+    SHARE_LINK_MAX_RECIPIENTS = int(os.environ.get('SHARE_LINK_MAX_RECIPIENTS') or 50)
+    
+    # Share token negative lookup filter (Bloom filter over active tokens)
+    SHARE_FILTER_ENABLED = os.environ.get('SHARE_FILTER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SHARE_FILTER_FP_RATE = float(os.environ.get('SHARE_FILTER_FP_RATE') or 0.001)
+    SHARE_FILTER_MAX_BYTES = int(os.environ.get('SHARE_FILTER_MAX_BYTES') or 16 * 1024 * 1024)
+    SHARE_FILTER_MIN_CAPACITY = int(os.environ.get('SHARE_FILTER_MIN_CAPACITY') or 100000)
+    # Links created by other workers are picked up every SHARE_FILTER_SYNC_SECONDS; misses are only
+    # rejected while the last sync is under SHARE_FILTER_MAX_STALE_SECONDS old
+    SHARE_FILTER_SYNC_SECONDS = float(os.environ.get('SHARE_FILTER_SYNC_SECONDS') or 1.0)
+    SHARE_FILTER_MAX_STALE_SECONDS = float(os.environ.get('SHARE_FILTER_MAX_STALE_SECONDS') or 10.0)
+    SHARE_FILTER_STALE_RATIO = float(os.environ.get('SHARE_FILTER_STALE_RATIO') or 0.25)
+    
+    # Request tracing; set PROFILE_SLOW_REQUESTS_MS to profile requests slower than that
+    TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() in ['true', 'on', '1']
+    TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER') or 'log'
+    PROFILE_SLOW_REQUESTS_MS = int(os.environ.get('PROFILE_SLOW_REQUESTS_MS') or 0)
+    PROFILE_INTERVAL_MS = int(os.environ.get('PROFILE_INTERVAL_MS') or 5)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+    
     # Registration Configuration
     ALLOW_OPEN_REGISTRATION = os.environ.get('ALLOW_OPEN_REGISTRATION', 'false').lower() in ['true', 'on', '1']
\ No newline at end of file
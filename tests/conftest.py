@@ -0,0 +1,71 @@
+import io
+import os
+import sys
+
+import bcrypt
+import email_validator
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app, db
+from app.models import User
+
+PASSWORD = 'secret1'
+# Few rounds keep logins in tests fast
+PASSWORD_HASH = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4)).decode('utf-8')
+
+
+@pytest.fixture(autouse=True)
+def no_dns(monkeypatch):
+    monkeypatch.setattr(email_validator, 'CHECK_DELIVERABILITY', False)
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on a fresh SQLite database with an admin (a@example.com) and a user (b@example.com)"""
+    def factory(**overrides):
+        settings = {
+            'TESTING': True,
+            'JWT_SECRET_KEY': 'test-jwt-secret-key-of-sufficient-length',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'PROFILE_DIR': str(tmp_path / 'profiles'),
+            'MAIL_SUPPRESS_SEND': True,
+            'TRACE_EXPORTER': 'none',
+            'METADATA_WORKERS': 0,
+            'PREVIEW_ENABLED': False,
+            **overrides
+        }
+        app = create_app(type('TestConfig', (Config,), settings))
+        with app.app_context():
+            db.create_all()
+            if not User.query.first():
+                admin = User(email='a@example.com', name='Admin', is_admin=True, password_hash=PASSWORD_HASH)
+                user = User(email='b@example.com', name='User', password_hash=PASSWORD_HASH)
+                db.session.add_all([admin, user])
+                db.session.commit()
+        return app
+    return factory
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, email='a@example.com'):
+    response = client.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def upload(client, headers, data=b'hello world', name='hello.txt', **form):
+    form['file'] = (io.BytesIO(data), name)
+    return client.post('/api/upload/', headers=headers, data=form, content_type='multipart/form-data')
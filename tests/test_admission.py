@@ -0,0 +1,137 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from app import upload_admission
+from app.admission import AdmissionRejected, UploadAdmission
+from app.models import User
+from conftest import login, upload
+
+
+def make_admission(**settings):
+    app = Flask(__name__)
+    app.config.update({'UPLOAD_ADAPTIVE': False, 'UPLOAD_QUEUE_TIMEOUT': 0.05, **settings})
+    return UploadAdmission(app)
+
+
+def test_acquire_and_release_track_active_uploads():
+    admission = make_admission(UPLOAD_MAX_CONCURRENT=2)
+    admission.acquire('a')
+    admission.acquire('b')
+    assert admission.stats()['active'] == 2
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('c')
+
+    admission.release('a', 100, 0.1)
+    admission.acquire('c')
+    stats = admission.stats()
+    assert (stats['active'], stats['admitted'], stats['rejected']) == (2, 3, 1)
+
+
+def test_per_user_cap_leaves_room_for_others():
+    admission = make_admission(UPLOAD_MAX_CONCURRENT=8, UPLOAD_MAX_PER_USER=1)
+    admission.acquire('a')
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('a')
+    admission.acquire('b')
+
+
+def test_queued_upload_gets_the_released_slot():
+    admission = make_admission(UPLOAD_MAX_CONCURRENT=1, UPLOAD_QUEUE_TIMEOUT=5)
+    admission.acquire('a')
+    threading.Timer(0.1, admission.release, args=('a', 100, 0.1)).start()
+    waited = admission.acquire('b')
+    assert 0.05 < waited < 5
+    assert admission.stats()['queued'] == 1
+
+
+def test_full_queue_rejects_without_waiting():
+    admission = make_admission(UPLOAD_MAX_CONCURRENT=1, UPLOAD_QUEUE_MAX=0, UPLOAD_QUEUE_TIMEOUT=5)
+    admission.acquire('a')
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire('b')
+    assert time.monotonic() - started < 1
+    assert 1 <= rejected.value.retry_after <= admission.max_retry_after
+
+
+def test_adaptive_limit_steps_down_when_throughput_stops_growing(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr('app.admission.time', SimpleNamespace(monotonic=lambda: clock[0]))
+    admission = make_admission(UPLOAD_ADAPTIVE=True, UPLOAD_MAX_CONCURRENT=4, UPLOAD_MIN_CONCURRENT=1)
+    # Two saturated windows at the same throughput: a larger limit isn't paying off
+    for _ in range(2):
+        for _ in range(8):
+            admission.acquire('a')
+            admission._window_saturated = True
+            clock[0] += 1
+            admission.release('a', 1000, 1)
+    assert admission.limit == 3
+    assert admission.stats()['adjustments'] == 1
+
+
+def test_rejected_upload_gets_503_with_retry_after(make_app):
+    app = make_app(UPLOAD_MAX_PER_USER=1, UPLOAD_QUEUE_TIMEOUT=0.05, UPLOAD_ADAPTIVE=False)
+    client = app.test_client()
+    headers = login(client)
+    with app.app_context():
+        user_id = User.query.filter_by(email='a@example.com').first().id
+
+    upload_admission.acquire(user_id)
+    try:
+        response = upload(client, headers)
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+        # Other users are not held back
+        assert upload(client, login(client, 'b@example.com')).status_code == 201
+    finally:
+        upload_admission.release(user_id, 0, 0)
+    assert upload(client, headers).status_code == 201
+
+
+def test_parts_of_a_session_share_one_slot():
+    admission = make_admission(UPLOAD_MAX_CONCURRENT=8, UPLOAD_MAX_PER_USER=1, UPLOAD_MAX_PARTS_PER_SESSION=4)
+    for _ in range(4):
+        admission.acquire('a', 'session-1')
+    assert admission.stats()['active'] == 1
+    # No more parts fit on the slot, and the user has no other
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('a', 'session-1')
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('a', 'session-2')
+    # Another user can't ride on the session
+    admission.acquire('b', 'session-1')
+    assert admission.stats()['active'] == 2
+
+    for _ in range(3):
+        admission.release('a', 100, 0.1, 'session-1')
+    assert admission.stats()['active'] == 2
+    admission.release('a', 100, 0.1, 'session-1')
+    admission.acquire('a', 'session-2')
+
+
+def test_parts_over_the_session_cap_wait_for_a_sibling():
+    admission = make_admission(UPLOAD_MAX_PARTS_PER_SESSION=2, UPLOAD_QUEUE_TIMEOUT=5)
+    admission.acquire('a', 'session-1')
+    admission.acquire('a', 'session-1')
+    threading.Timer(0.1, admission.release, args=('a', 100, 0.1, 'session-1')).start()
+    waited = admission.acquire('a', 'session-1')
+    assert 0.05 < waited < 5
+    stats = admission.stats()
+    assert (stats['active'], stats['active_sessions'], stats['queued']) == (1, 1, 1)
+
+
+def test_queued_parts_join_their_sessions_slot():
+    admission = make_admission(UPLOAD_MAX_CONCURRENT=1, UPLOAD_QUEUE_TIMEOUT=5)
+    admission.acquire('b')
+    waiters = [threading.Thread(target=admission.acquire, args=('a', 'session-1')) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    admission.release('b', 100, 0.1)
+    for waiter in waiters:
+        waiter.join(2)
+    stats = admission.stats()
+    assert (stats['active'], stats['active_sessions'], stats['rejected']) == (1, 1, 0)
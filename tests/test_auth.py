@@ -0,0 +1,45 @@
+from app import db
+from app.models import User
+from conftest import login, upload
+
+
+def user_id(app, email):
+    with app.app_context():
+        return User.query.filter_by(email=email).first().id
+
+
+def test_deactivated_users_existing_token_is_rejected(app, client):
+    admin = login(client)
+    user = login(client, 'b@example.com')
+    assert client.get('/api/upload/my-uploads', headers=user).status_code == 200
+
+    response = client.post('/api/admin/users/bulk-deactivate', headers=admin,
+                           json={'user_ids': [user_id(app, 'b@example.com')]})
+    assert response.status_code == 200
+
+    for method, path in [('get', '/api/upload/my-uploads'), ('get', '/api/auth/me'),
+                         ('post', '/api/upload/sessions'), ('delete', '/api/upload/some-id')]:
+        response = getattr(client, method)(path, headers=user, json={})
+        assert response.status_code == 401, path
+        assert response.get_json()['error'] == 'User not found or deactivated'
+    assert upload(client, user).status_code == 401
+
+
+def test_reactivated_user_token_works_again(app, client):
+    user = login(client, 'b@example.com')
+    with app.app_context():
+        db.session.get(User, user_id(app, 'b@example.com')).is_active = False
+        db.session.commit()
+    assert client.get('/api/auth/me', headers=user).status_code == 401
+
+    with app.app_context():
+        db.session.get(User, user_id(app, 'b@example.com')).is_active = True
+        db.session.commit()
+    assert client.get('/api/auth/me', headers=user).status_code == 200
+
+
+def test_deleted_users_token_is_rejected(app, client):
+    admin = login(client)
+    user = login(client, 'b@example.com')
+    assert client.delete(f"/api/admin/users/{user_id(app, 'b@example.com')}", headers=admin).status_code == 200
+    assert client.get('/api/upload/my-uploads', headers=user).status_code == 401
@@ -0,0 +1,96 @@
+import hashlib
+import os
+
+from app import db, metadata_extractor, upload_admission
+from app.models import FileUpload, UploadSession, User
+from conftest import login, upload
+
+DATA = b'0123456789abcdefghij!'
+
+
+def start_session(client, headers, data=DATA):
+    response = client.post('/api/upload/sessions', headers=headers, json={'filename': 'data.bin', 'size': len(data)})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['session']
+
+
+def put_part(client, headers, session, number, data=DATA, digest=None):
+    body = data[number * session['part_size']:(number + 1) * session['part_size']]
+    return client.put(f"/api/upload/sessions/{session['id']}/parts/{number}", headers={
+        **headers, 'X-Content-SHA256': digest or hashlib.sha256(body).hexdigest()
+    }, data=body)
+
+
+def test_chunked_upload_completes_once_every_part_is_verified(make_app):
+    app = make_app(UPLOAD_PART_SIZE=8)
+    client = app.test_client()
+    headers = login(client)
+    session = start_session(client, headers)
+    assert session['part_count'] == 3
+
+    assert put_part(client, headers, session, 2).status_code == 201
+    response = put_part(client, headers, session, 0, digest='0' * 64)
+    assert response.status_code == 400 and 'send it again' in response.get_json()['error']
+    assert put_part(client, headers, session, 3).status_code == 400
+
+    response = client.post(f"/api/upload/sessions/{session['id']}/complete", headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['missing_parts'] == [0, 1]
+
+    assert put_part(client, headers, session, 1).status_code == 201
+    assert put_part(client, headers, session, 0).status_code == 201
+    response = client.post(f"/api/upload/sessions/{session['id']}/complete", headers=headers)
+    assert response.status_code == 201, response.get_json()
+    created = response.get_json()['upload']
+    assert created['size'] == len(DATA)
+
+    assert client.get(f"/share/{created['share_token']}").data == DATA
+    with app.app_context():
+        assert UploadSession.query.count() == 0
+        # The whole-file digest comes from the assembled file
+        metadata_extractor.backfill()
+        assert db.session.get(FileUpload, created['id']).sha256 == hashlib.sha256(DATA).hexdigest()
+
+
+def test_parts_of_one_session_share_an_admission_slot(make_app):
+    app = make_app(UPLOAD_PART_SIZE=8, UPLOAD_MAX_PER_USER=1, UPLOAD_QUEUE_TIMEOUT=0.05, UPLOAD_ADAPTIVE=False)
+    client = app.test_client()
+    headers = login(client)
+    session = start_session(client, headers)
+    with app.app_context():
+        user_id = User.query.filter_by(email='a@example.com').first().id
+
+    # Stand in for a part of this session that is still being sent
+    upload_admission.acquire(user_id, session['id'])
+    try:
+        assert put_part(client, headers, session, 0).status_code == 201
+        assert put_part(client, headers, session, 1).status_code == 201
+        # A separate upload by the same user is still over the per-user cap
+        assert upload(client, headers).status_code == 503
+    finally:
+        upload_admission.release(user_id, 0, 0, session['id'])
+    assert upload_admission.stats()['active'] == 0
+    assert put_part(client, headers, session, 2).status_code == 201
+
+
+def test_bad_resend_leaves_the_accepted_part_alone(make_app):
+    app = make_app(UPLOAD_PART_SIZE=8)
+    client = app.test_client()
+    headers = login(client)
+    session = start_session(client, headers)
+    for number in range(3):
+        assert put_part(client, headers, session, number).status_code == 201
+
+    corrupted = b'X' * 8
+    accepted = hashlib.sha256(DATA[:8]).hexdigest()
+    assert put_part(client, headers, session, 0, data=corrupted + DATA[8:], digest=accepted).status_code == 400
+    response = client.put(f"/api/upload/sessions/{session['id']}/parts/1", headers={
+        **headers, 'X-Content-SHA256': hashlib.sha256(corrupted).hexdigest()
+    }, data=corrupted[:5], environ_overrides={'CONTENT_LENGTH': '8'})
+    assert response.get_json()['error'] == 'Incomplete part'
+
+    response = client.post(f"/api/upload/sessions/{session['id']}/complete", headers=headers)
+    assert response.status_code == 201, response.get_json()
+    assert client.get(f"/share/{response.get_json()['upload']['share_token']}").data == DATA
+    partial_folder = app.config.get('UPLOAD_PARTIAL_FOLDER') or os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+    assert not [name for name in os.listdir(partial_folder) if name.endswith('.tmp')]
@@ -0,0 +1,79 @@
+import json
+import logging
+import sys
+import types
+
+from app.events import LocalBroker, RedisBroker, format_sse
+
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def subscribe(self, channel):
+        pass
+
+    def listen(self):
+        yield from self.messages
+
+
+class FakeRedis:
+    messages = []
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self.messages)
+
+
+def make_redis_broker(monkeypatch, messages):
+    FakeRedis.messages = messages
+    monkeypatch.setitem(sys.modules, 'redis', types.SimpleNamespace(Redis=FakeRedis))
+    return RedisBroker('redis://example', logger=logging.getLogger('test.events'))
+
+
+def test_local_broker_delivers_to_the_users_subscriptions_only():
+    broker = LocalBroker()
+    mine = broker.subscribe('u1')
+    other = broker.subscribe('u2')
+
+    broker.publish('u1', 'upload.created', {'id': 'x'})
+
+    assert mine.get(timeout=0)['data'] == {'id': 'x'}
+    assert other.get(timeout=0) is None
+
+
+def test_full_subscription_drops_instead_of_blocking():
+    broker = LocalBroker(max_queue_size=1)
+    subscription = broker.subscribe('u1')
+
+    broker.publish('u1', 'upload.created', {})
+    broker.publish('u1', 'upload.created', {})
+
+    assert subscription.dropped == 1
+
+
+def test_format_sse():
+    frame = format_sse({'id': 3, 'event': 'upload.deleted', 'data': {'id': 'a'}})
+    assert frame == 'id: 3\nevent: upload.deleted\ndata: {"id":"a"}\n\n'
+
+
+def test_redis_listener_skips_malformed_messages(monkeypatch, caplog):
+    good = {'data': json.dumps({'user_id': 'u1', 'event': 'upload.created', 'data': {'id': 'a'}})}
+    messages = [
+        {'data': b'not json'},
+        {'data': json.dumps({'user_id': 'u1'})},
+        {'data': json.dumps(['a', 'list'])},
+        {'data': None},
+        good,
+    ]
+    broker = make_redis_broker(monkeypatch, messages)
+    subscription = LocalBroker.subscribe(broker, 'u1')
+
+    with caplog.at_level(logging.ERROR, logger='test.events'):
+        broker._listen()
+
+    assert subscription.get(timeout=0)['event'] == 'upload.created'
+    assert len([r for r in caplog.records if 'malformed' in r.getMessage()]) == 4
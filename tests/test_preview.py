@@ -0,0 +1,113 @@
+import io
+import os
+import subprocess
+import time
+from concurrent.futures import Future
+
+import pytest
+from flask import Flask
+
+from app.preview import PreviewCache, PreviewGenerator
+from conftest import login, upload
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def write_preview(cache, key, size, mtime):
+    with open(cache.path(key), 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(cache.path(key), (mtime, mtime))
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = PreviewCache(str(tmp_path), max_bytes=25)
+    for key in ('a', 'b'):
+        write_preview(cache, key, 10, 1000)
+        cache.add(key, 10)
+    assert cache.get('a')
+
+    write_preview(cache, 'c', 10, 1000)
+    cache.add('c', 10)
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.stats()['evictions'] == 1
+    assert not os.path.exists(cache.path('b'))
+
+
+def test_cache_reloads_folder_in_order_of_use(tmp_path):
+    folder = tmp_path / 'previews'
+    folder.mkdir()
+    for name, mtime in (('old', 1000), ('new', 3000), ('mid', 2000)):
+        (folder / f'{name}.jpg').write_bytes(b'x' * 10)
+        os.utime(folder / f'{name}.jpg', (mtime, mtime))
+    (folder / 'half.jpg.tmp').write_bytes(b'x')
+
+    cache = PreviewCache(str(folder), max_bytes=20)
+    assert sorted(os.listdir(folder)) == ['mid.jpg', 'new.jpg']
+    assert cache.stats()['bytes'] == 20
+
+
+def make_generator(tmp_path, **settings):
+    app = Flask(__name__)
+    app.config.update({'UPLOAD_FOLDER': str(tmp_path), **settings})
+    return PreviewGenerator(app)
+
+
+def finish(generator, key, error=None):
+    future = Future()
+    if error:
+        future.set_exception(error)
+    else:
+        future.set_result(1)
+    generator._finished(key, future)
+
+
+def test_failures_are_remembered_for_a_while(tmp_path):
+    generator = make_generator(tmp_path, PREVIEW_FAILURE_TTL=3600)
+    finish(generator, 'bad', ValueError('cannot identify image file'))
+    assert generator._failed_recently('bad')
+
+    generator.failure_ttl = 0
+    assert not generator._failed_recently('bad')
+    assert 'bad' not in generator._failed
+
+
+def test_timeouts_are_retried(tmp_path):
+    generator = make_generator(tmp_path)
+    finish(generator, 'slow', subprocess.TimeoutExpired('pdftoppm', 30))
+    assert not generator._failed_recently('slow')
+    assert generator.metrics['failed'] == 1
+
+
+def png_bytes(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGBA', (width, height), (200, 10, 10, 128)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_share_preview_is_rendered_once_and_cached(make_app):
+    app = make_app(PREVIEW_ENABLED=True, PREVIEW_WORKERS=1, PREVIEW_WAIT_SECONDS=30)
+    client = app.test_client()
+    generator = app.extensions['preview_generator']
+    rendered = generator.metrics['rendered']
+    headers = login(client)
+    token = upload(client, headers, png_bytes(800, 400), 'wide.png').get_json()['upload']['share_token']
+    assert client.get(f'/share/{token}/info').get_json()['file']['has_preview']
+
+    response = client.get(f'/share/{token}/preview')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).size == (320, 160)
+    assert response.cache_control.public
+
+    assert client.get(f'/share/{token}/preview').data == response.data
+    # The job's done callback may still be running
+    deadline = time.monotonic() + 5
+    while generator.metrics['rendered'] == rendered and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = generator.stats()
+    assert stats['rendered'] == rendered + 1
+    assert stats['cache']['hits'] >= 1
+
+    text_token = upload(client, headers).get_json()['upload']['share_token']
+    assert client.get(f'/share/{text_token}/preview').status_code == 404
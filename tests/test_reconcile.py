@@ -0,0 +1,80 @@
+import os
+from collections import namedtuple
+
+from app import db
+from app.models import FileUpload, User
+from app.reconcile import MISSING_FILE, ORPHAN_FILE, STALE_FILE, iter_disk_paths, merge_join, reconcile
+
+Row = namedtuple('Row', 'upload_path id is_active')
+
+
+def write_file(path, data=b'x'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def add_row(path, is_active=True):
+    owner = User.query.filter_by(email='b@example.com').first()
+    row = FileUpload(
+        original_name=os.path.basename(path), filename=os.path.basename(path), upload_path=path, size=1,
+        share_token=os.urandom(16).hex(), uploader_id=owner.id, is_active=is_active
+    )
+    db.session.add(row)
+    db.session.commit()
+    return row.id
+
+
+def test_merge_join_reports_each_side():
+    disk = ['/a', '/b', '/d', '/f']
+    rows = [Row('/b', 1, True), Row('/c', 2, True), Row('/d', 3, False), Row('/e', 4, False), Row('/g', 5, True)]
+    findings = [(kind, path) for kind, path, _ in merge_join(disk, rows)]
+    assert findings == [
+        (ORPHAN_FILE, '/a'),
+        (MISSING_FILE, '/c'),
+        (STALE_FILE, '/d'),
+        (ORPHAN_FILE, '/f'),
+        (MISSING_FILE, '/g')
+    ]
+
+
+def test_disk_paths_are_sorted_across_runs_and_skip_hidden_directories(tmp_path):
+    names = ['b/2', 'a/9', 'a/1', 'c', 'b/10', '.partial/x']
+    for name in names:
+        write_file(str(tmp_path / 'root' / name))
+    paths = list(iter_disk_paths([str(tmp_path / 'root')], workers=2, run_size=1, tmp_dir=str(tmp_path)))
+    expected = sorted(str(tmp_path / 'root' / name) for name in names if not name.startswith('.'))
+    assert paths == expected
+
+
+def test_reconcile_finds_and_fixes_inconsistencies(app):
+    root = app.config['UPLOAD_FOLDER']
+    kept, orphan, stale, missing, fresh = (os.path.join(root, name) for name in
+                                           ('kept', 'orphan', 'stale', 'missing', 'fresh'))
+    for path in (kept, orphan, stale):
+        write_file(path)
+        os.utime(path, (0, 0))
+    write_file(fresh)
+
+    with app.app_context():
+        add_row(kept)
+        add_row(stale, is_active=False)
+        missing_id = add_row(missing)
+
+        findings = []
+        stats = reconcile([root], batch_size=2, run_size=2, grace_seconds=60, on_finding=findings.append)
+        assert (stats[ORPHAN_FILE], stats[STALE_FILE], stats[MISSING_FILE]) == (1, 1, 1)
+        assert sorted((f['kind'], f['path']) for f in findings) == sorted(
+            [(ORPHAN_FILE, orphan), (STALE_FILE, stale), (MISSING_FILE, missing)]
+        )
+        # Nothing changes without --fix; files inside the grace period are left alone
+        assert os.path.exists(orphan) and os.path.exists(fresh)
+
+        stats = reconcile([root], apply_fixes=True, grace_seconds=60)
+        assert stats['fixed'] == 3
+        assert not os.path.exists(orphan) and not os.path.exists(stale)
+        assert os.path.exists(kept) and os.path.exists(fresh)
+        assert not db.session.get(FileUpload, missing_id).is_active
+
+        stats = reconcile([root], grace_seconds=60)
+        assert (stats[ORPHAN_FILE], stats[STALE_FILE], stats[MISSING_FILE]) == (0, 0, 0)
@@ -0,0 +1,47 @@
+import pytest
+
+from app.search import query_terms
+from conftest import login, upload
+
+
+def search_all(client, headers, **params):
+    names, cursor = [], None
+    while True:
+        query = dict(params, limit=2, **({'cursor': cursor} if cursor else {}))
+        data = client.get('/api/upload/search', headers=headers, query_string=query).get_json()
+        names += [item['original_name'] for item in data['uploads']]
+        cursor = data['next_cursor']
+        if not cursor:
+            return names
+
+
+@pytest.mark.parametrize('common_matches', [1, 1000])
+def test_fulltext_search_pages_in_order_with_either_plan(client, monkeypatch, common_matches):
+    # 1 makes every term "common" (walk the sort index), 1000 none (sort the matches)
+    monkeypatch.setattr('app.search.SQLITE_COMMON_MATCHES', common_matches)
+    headers = login(client)
+    for name, size in (('invoice_march.pdf', 300), ('budget.txt', 10), ('invoice_april.pdf', 100),
+                       ('final_invoice.png', 200), ('photo.png', 50)):
+        # Types are detected from content, so the images get a PNG signature
+        data = b'\x89PNG\r\n\x1a\n' + b'x' * (size - 8) if name.endswith('.png') else b'x' * size
+        upload(client, headers, data, name)
+
+    assert search_all(client, headers, q='invoice') == ['final_invoice.png', 'invoice_april.pdf', 'invoice_march.pdf']
+    assert search_all(client, headers, q='invoice', sort='size', order='asc') == [
+        'invoice_april.pdf', 'final_invoice.png', 'invoice_march.pdf'
+    ]
+    assert search_all(client, headers, q='invoice', mime_type='image/') == ['final_invoice.png']
+    assert search_all(client, headers, q='inv mar') == ['invoice_march.pdf']
+    assert search_all(client, headers, q='nothing') == []
+
+
+def test_names_and_addresses_match_on_their_parts(client):
+    # PostgreSQL indexes the same words through PG_SEARCH_VECTOR's regexp_replace
+    assert query_terms('Invoice_March.pdf') == ['invoice', 'march', 'pdf']
+    headers = login(client)
+    upload(client, headers, b'x' * 10, 'invoice_march.pdf', recipient_email='user7@corp.io')
+    upload(client, headers, b'x' * 10, 'notes.txt')
+
+    assert search_all(client, headers, q='pdf') == ['invoice_march.pdf']
+    assert search_all(client, headers, q='corp') == ['invoice_march.pdf']
+    assert search_all(client, headers, q='invoice_march') == ['invoice_march.pdf']
@@ -0,0 +1,46 @@
+from app import db
+from app.models import FileUpload, ShareLink
+from conftest import login, upload
+
+
+def links_by_token(client, headers, upload_id):
+    links = client.get(f'/api/upload/{upload_id}/links', headers=headers).get_json()['links']
+    return {link['token']: link for link in links}
+
+
+def test_download_counts_are_kept_per_link(app, client):
+    headers = login(client)
+    created = upload(client, headers, max_downloads='1').get_json()['upload']
+    original = created['share_token']
+    response = client.post(f"/api/upload/{created['id']}/links", headers=headers,
+                           json={'max_downloads': 5, 'notify': False})
+    extra = response.get_json()['links'][0]['token']
+
+    for _ in range(3):
+        assert client.get(f'/share/{extra}').status_code == 200
+    assert client.get(f'/share/{original}').status_code == 200
+    assert client.get(f'/share/{original}').status_code == 410
+    assert client.get(f'/share/{extra}').status_code == 200
+
+    links = links_by_token(client, headers, created['id'])
+    assert (links[original]['download_count'], links[original]['max_downloads']) == (1, 1)
+    assert (links[extra]['download_count'], links[extra]['max_downloads']) == (4, 5)
+
+    # The upload's own count stays that of its original link, so it never exceeds its limit
+    uploads = client.get('/api/upload/my-uploads', headers=headers).get_json()['uploads']
+    assert [(u['download_count'], u['max_downloads']) for u in uploads] == [(1, 1)]
+    assert client.get(f'/share/{extra}/info').get_json()['file']['download_count'] == 4
+
+
+def test_revoked_link_does_not_affect_the_others(app, client):
+    headers = login(client)
+    created = upload(client, headers).get_json()['upload']
+    response = client.post(f"/api/upload/{created['id']}/links", headers=headers, json={'notify': False})
+    extra = response.get_json()['links'][0]
+
+    assert client.delete(f"/api/upload/{created['id']}/links/{extra['id']}", headers=headers).status_code == 200
+    assert client.get(f"/share/{extra['token']}").status_code == 404
+    assert client.get(f"/share/{created['share_token']}").status_code == 200
+    with app.app_context():
+        assert db.session.get(FileUpload, created['id']).download_count == 1
+        assert ShareLink.query.filter_by(token=extra['token']).one().download_count == 0
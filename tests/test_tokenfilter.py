@@ -0,0 +1,153 @@
+import secrets
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import db, token_filter
+from app.models import FileUpload, ShareLink
+from app.tokenfilter import BloomFilter
+from conftest import login, upload
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def build_filter(client):
+    """Trigger the background build with a lookup and wait for it"""
+    client.get(f'/share/{secrets.token_urlsafe(32)}/info')
+    wait_until(lambda: token_filter.stats()['ready'])
+
+
+def add_link_elsewhere(app, upload_id, **fields):
+    """Create a link the way another worker would: in the database only"""
+    token = secrets.token_urlsafe(32)
+    with app.app_context():
+        db.session.add(ShareLink(upload_id=upload_id, token=token, **fields))
+        db.session.commit()
+    return token
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(5000, 0.01)
+    tokens = [secrets.token_urlsafe(32) for _ in range(5000)]
+    for token in tokens:
+        bloom.add(token)
+    assert all(token in bloom for token in tokens)
+    false_positives = sum(secrets.token_urlsafe(32) in bloom for _ in range(5000))
+    assert false_positives < 5000 * 0.03
+
+
+def count_share_link_queries(app):
+    """Collect the SQL statements that read share_links while the returned list is alive"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if 'share_links' in statement:
+            statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+    return statements, lambda: event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_invalid_tokens_are_rejected_without_the_database(make_app):
+    app = make_app(SHARE_FILTER_SYNC_SECONDS=3600)
+    client = app.test_client()
+    build_filter(client)
+
+    statements, stop = count_share_link_queries(app)
+    try:
+        for _ in range(200):
+            assert client.get(f'/share/{secrets.token_urlsafe(32)}/info').status_code == 404
+    finally:
+        with app.app_context():
+            stop()
+    assert statements == []
+    stats = token_filter.stats()
+    assert stats['rejected'] >= 200
+    assert stats['unsynced'] == 0
+
+
+def test_link_from_another_worker_is_found_after_the_next_sync(make_app):
+    app = make_app(SHARE_FILTER_SYNC_SECONDS=0.05)
+    client = app.test_client()
+    headers = login(client)
+    upload_id = upload(client, headers).get_json()['upload']['id']
+    build_filter(client)
+
+    token = add_link_elsewhere(app, upload_id)
+    syncs = token_filter.stats()['syncs']
+    # One sync may have started before the link was committed
+    wait_until(lambda: token_filter.stats()['syncs'] >= syncs + 2)
+    assert client.get(f'/share/{token}/info').status_code == 200
+    assert client.get(f'/share/{token}').status_code == 200
+
+
+def test_misses_reach_the_database_while_sync_is_behind(make_app):
+    app = make_app(SHARE_FILTER_SYNC_SECONDS=3600, SHARE_FILTER_MAX_STALE_SECONDS=0)
+    client = app.test_client()
+    headers = login(client)
+    upload_id = upload(client, headers).get_json()['upload']['id']
+    build_filter(client)
+
+    token = add_link_elsewhere(app, upload_id)
+    assert client.get(f'/share/{token}/info').status_code == 200
+    assert client.get(f'/share/{secrets.token_urlsafe(32)}/info').status_code == 404
+    stats = token_filter.stats()
+    assert (stats['unsynced'], stats['rejected']) == (2, 0)
+
+
+def test_expired_link_answers_410_after_a_rebuild(app, client):
+    headers = login(client)
+    upload_id = upload(client, headers, expiration_hours='1').get_json()['upload']['id']
+    with app.app_context():
+        link = ShareLink.query.filter_by(upload_id=upload_id).one()
+        link.expires_at = datetime.utcnow() - timedelta(minutes=1)
+        token = link.token
+        db.session.commit()
+
+    build_filter(client)
+    assert client.get(f'/share/{token}').status_code == 410
+    assert client.get(f'/share/{token}/info').status_code == 410
+
+
+def test_deactivated_upload_is_rejected_after_a_rebuild(app, client):
+    headers = login(client)
+    created = upload(client, headers).get_json()['upload']
+    assert client.delete(f"/api/upload/{created['id']}", headers=headers).status_code == 200
+
+    build_filter(client)
+    assert client.get(f"/share/{created['share_token']}/info").status_code == 404
+
+
+def test_false_positives_count_only_filter_answers(make_app):
+    app = make_app(SHARE_FILTER_SYNC_SECONDS=3600)
+    client = app.test_client()
+
+    # Filter not built yet: the lookup fails open and is not a false positive
+    assert client.get(f'/share/{secrets.token_urlsafe(32)}/info').status_code == 404
+    wait_until(lambda: token_filter.stats()['ready'])
+    assert token_filter.stats()['false_positives'] == 0
+
+    # A rejected miss never reaches the database
+    client.get(f'/share/{secrets.token_urlsafe(32)}/info')
+    assert token_filter.stats()['rejected'] == 1
+    assert token_filter.stats()['false_positives'] == 0
+
+    # A token the filter says "maybe" to but the database lacks is one
+    ghost = secrets.token_urlsafe(32)
+    token_filter.add(ghost)
+    assert client.get(f'/share/{ghost}/info').status_code == 404
+    assert token_filter.stats()['false_positives'] == 1
+
+
+def test_disabled_filter_records_nothing(make_app):
+    app = make_app(SHARE_FILTER_ENABLED=False)
+    client = app.test_client()
+    assert client.get(f'/share/{secrets.token_urlsafe(32)}/info').status_code == 404
+    assert token_filter.stats()['false_positives'] == 0